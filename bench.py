@@ -0,0 +1,395 @@
+#!/usr/bin/env python
+'''Benchmarks compiled pipelines and canvas drawing.
+
+    python bench.py scripts [--sizes 1M,100M] [--check] [-o scripts.json]
+    python bench.py render [--nodes 100,10000] [-o render.json]
+    python bench.py compare old.json new.json
+
+Both benchmarks write their results as JSON, and compare prints how the
+timings of two such files differ.  With --check, every graph also runs
+in-process, and its outputs must match those of its script.'''
+from __future__ import division, print_function
+
+import os
+import sys
+import json
+import time
+import shutil
+import filecmp
+import platform
+import argparse
+import tempfile
+import subprocess
+
+import codegen
+import components
+import registry
+import runtime
+
+FORMAT_VERSION = 1
+
+# Inputs are made by repeating this block of "n,2n" lines, so every size
+# holds the same data and generating gigabytes stays cheap.
+INPUT_BLOCK = ''.join('{},{}\n'.format(n, n * 2) for n in range(1, 100001))
+
+UNITS = {'K': 2 ** 10, 'M': 2 ** 20, 'G': 2 ** 30}
+
+# How often the process count is sampled while a script runs, in seconds.
+PROCESS_POLL = 0.01
+
+def parse_size(text):
+    unit = UNITS.get(text[-1:].upper())
+    if unit is None:
+        return int(text)
+    return int(float(text[:-1]) * unit)
+
+def make_input(path, size):
+    with open(path, 'w') as f:
+        for i in range(size // len(INPUT_BLOCK)):
+            f.write(INPUT_BLOCK)
+        rest = INPUT_BLOCK[:size % len(INPUT_BLOCK)]
+        f.write(rest[:rest.rfind('\n') + 1])
+
+def connect(*chain):
+    for start, end in zip(chain, chain[1:]):
+        components.Pipe(start, end)
+
+def make_component(cls, **properties):
+    component = cls()
+    component.set_properties(properties)
+    return component
+
+def make_chain(cls, input_file, output_file, length=4):
+    'File Input, then length components of type cls, then File Output.'
+    source = make_component(components.FileInputComponent,
+                            input_file=input_file)
+    sink = make_component(components.FileOutputComponent,
+                          output_file=output_file)
+    middle = [make_component(cls, **CHAIN_PROPERTIES.get(cls, {}))
+              for i in range(length)]
+    chain = [source] + middle + [sink]
+    connect(*chain)
+    return chain
+
+def make_fan(cls, input_file, output_file):
+    'A Split fanning out to both inputs of one cls, which fans them in.'
+    source = make_component(components.FileInputComponent,
+                            input_file=input_file)
+    split = make_component(components.SplitComponent, delim=',')
+    combine = cls()
+    sink = make_component(components.FileOutputComponent,
+                          output_file=output_file)
+    connect(source, split)
+    components.Pipe(split, combine)
+    components.Pipe(split, combine)
+    connect(combine, sink)
+    return [source, split, combine, sink]
+
+def make_wide(cls, input_file, output_file, width=8):
+    'A Split into width columns, each through its own cls to its own file.'
+    source = make_component(components.FileInputComponent,
+                            input_file=input_file)
+    split = make_component(components.SplitComponent, delim=',',
+                           outputs=width)
+    graph = [source, split]
+    connect(source, split)
+    for i in range(width):
+        middle = make_component(cls, **CHAIN_PROPERTIES.get(cls, {}))
+        sink = make_component(components.FileOutputComponent,
+                              output_file='{}.{}'.format(output_file, i))
+        connect(split, middle, sink)
+        graph.extend([middle, sink])
+    return graph
+
+CHAIN_PROPERTIES = {
+    components.FilterComponent: {'patterns': ['1']},
+    components.UniqComponent: {'count': True},
+}
+
+SHAPES = {
+    'chain': make_chain,
+    'fan': make_fan,
+    'wide': make_wide,
+}
+
+CASES = [
+    ('chain', components.FilterComponent),
+    ('chain', components.SumComponent),
+    ('chain', components.MeanComponent),
+    ('fan', components.AddComponent),
+    ('fan', components.SubtractComponent),
+    ('fan', components.MultiplyComponent),
+    ('wide', components.FilterComponent),
+    ('wide', components.SumComponent),
+    ('wide', components.UniqComponent),
+    ('wide', components.GroupByComponent),
+]
+
+def count_descendants(pid):
+    'Returns how many processes descend from pid, or None without /proc.'
+    parents = {}
+    try:
+        names = os.listdir('/proc')
+    except OSError:
+        return None
+    for name in names:
+        if not name.isdigit():
+            continue
+        try:
+            with open('/proc/{}/stat'.format(name)) as f:
+                stat = f.read()
+        except IOError:
+            continue
+        ppid = int(stat[stat.rindex(')') + 2:].split()[1])
+        parents.setdefault(ppid, []).append(int(name))
+
+    count = 0
+    stack = [pid]
+    while stack:
+        children = parents.get(stack.pop(), [])
+        count += len(children)
+        stack.extend(children)
+    return count
+
+def run_script(path):
+    'Runs a script, returning its wall time and peak process count.'
+    start = time.time()
+    process = subprocess.Popen(['bash', path])
+    peak = 0
+    while process.poll() is None:
+        count = count_descendants(process.pid)
+        if count is None:
+            peak = None
+            process.wait()
+            break
+        peak = max(peak, count + 1)
+        time.sleep(PROCESS_POLL)
+    wall = time.time() - start
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, path)
+    return wall, peak
+
+def get_sinks(graph):
+    return [component.output_file for component in graph
+            if isinstance(component, components.FileOutputComponent)]
+
+def check_outputs(graph, expected):
+    '''Runs the graph expected in-process, returning whether it wrote the
+    same files as graph did.'''
+    pipeline = runtime.Pipeline(expected)
+    pipeline.start()
+    pipeline.wait()
+    if pipeline.errors:
+        return False
+    return all(filecmp.cmp(a, b, shallow=False)
+               for a, b in zip(get_sinks(graph), get_sinks(expected)))
+
+def bench_scripts(args):
+    workdir = tempfile.mkdtemp(prefix='plumber-bench.')
+    results = []
+    try:
+        for size in args.sizes:
+            input_file = os.path.join(workdir, 'input')
+            make_input(input_file, size)
+            size = os.path.getsize(input_file)
+
+            for shape, cls in CASES:
+                if args.shapes and shape not in args.shapes:
+                    continue
+                if args.components and cls.name not in args.components:
+                    continue
+
+                graph = SHAPES[shape](cls, input_file,
+                                      os.path.join(workdir, 'output'))
+                script = os.path.join(workdir, 'run.sh')
+                with open(script, 'w') as f:
+                    codegen.write_script(f, graph)
+
+                walls = []
+                for i in range(args.repeat):
+                    wall, processes = run_script(script)
+                    walls.append(wall)
+                wall = min(walls)
+
+                matches = None
+                if args.check:
+                    matches = check_outputs(graph, SHAPES[shape](
+                            cls, input_file, os.path.join(workdir, 'expected')))
+
+                result = {
+                    'name': '{} {} {}'.format(shape, cls.name, size),
+                    'shape': shape,
+                    'component': cls.name,
+                    'components': len(graph),
+                    'bytes': size,
+                    'wall': wall,
+                    'bytes_per_sec': size / wall,
+                    'processes': processes,
+                    'matches': matches,
+                }
+                results.append(result)
+                print('{name}: {wall:.3f}s, {mb:.1f} MB/s, {processes} '
+                      'processes{check}'.format(
+                              mb=result['bytes_per_sec'] / 2 ** 20,
+                              check={None: '', True: ', outputs match',
+                                     False: ', OUTPUTS DIFFER'}[matches],
+                              **result))
+    finally:
+        shutil.rmtree(workdir)
+    return results
+
+def bench_render(args):
+    # Only the render benchmark needs GTK.
+    import cairo
+    import gui
+
+    class App(object):
+        def __init__(self):
+            self.builder = gui.Gtk.Builder()
+            self.builder.add_from_file(gui.UI_FILE)
+            self.components = registry.get_components()
+
+    app = App()
+    widget = app.builder.get_object(gui.ID_CANVAS)
+    surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, args.width, args.height)
+
+    results = []
+    for count in args.nodes:
+        graph = []
+        for i in range(count):
+            component = components.SplitComponent()
+            if graph:
+                components.Pipe(graph[-1], component)
+            graph.append(component)
+
+        canvas = gui.Canvas(app, virtual=True)
+        canvas.init_ui()
+        start = time.time()
+        canvas.load(graph, [None] * count)
+        load = time.time() - start
+
+        for level in args.zoom_levels:
+            canvas.set_zoom_level(level, 0, 0)
+            frame = time_calls(args.repeat, lambda: canvas.do_draw(
+                    widget, cairo.Context(surface)))
+            results.append({
+                'name': 'canvas {} zoom {}'.format(count, level),
+                'nodes': count,
+                'zoom': canvas.zoom,
+                'load': load,
+                'frame': frame,
+            })
+            print('canvas, {} nodes, zoom {:.2f}: {:.2f} ms per frame'.format(
+                    count, canvas.zoom, frame * 1000))
+
+    # Drawing a component from scratch, as every sprite cache miss does.
+    node = gui.Node(components.SplitComponent(), 0, 0, 0)
+    ctx = cairo.Context(surface)
+    draw = time_calls(args.repeat * 100, lambda: node.draw_component(
+            ctx, node.CANVAS_WIDTH, node.CANVAS_HEIGHT))
+    results.append({'name': 'draw_component', 'frame': draw})
+    print('draw_component: {:.3f} ms'.format(draw * 1000))
+    return results
+
+def time_calls(repeat, function):
+    'Returns the best time of repeat calls.'
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        function()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def compare(args):
+    with open(args.old) as f:
+        old = dict((r['name'], r) for r in json.load(f)['results'])
+    with open(args.new) as f:
+        new = json.load(f)['results']
+
+    key = 'wall' if args.old_mode == 'scripts' else 'frame'
+    for result in new:
+        before = old.get(result['name'])
+        if before is None:
+            continue
+        print('{}: {:+.1%}'.format(result['name'],
+                                   result[key] / before[key] - 1))
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    subparsers = parser.add_subparsers(dest='mode')
+
+    scripts = subparsers.add_parser(
+            'scripts', help='time compiled scripts on generated input')
+    scripts.add_argument('--sizes', default='1M,10M,100M',
+                         help='comma separated input sizes, such as 1M or '
+                              '10G (default: %(default)s)')
+    scripts.add_argument('--shapes', help='comma separated graph shapes '
+                         'to run, of ' + ', '.join(sorted(SHAPES)))
+    scripts.add_argument('--components',
+                         help='comma separated component types to run')
+    scripts.add_argument('--check', action='store_true',
+                         help='also run each graph in-process, and fail if '
+                              'its outputs differ from the script\'s')
+
+    render = subparsers.add_parser(
+            'render', help='time drawing the canvas offscreen')
+    render.add_argument('--nodes', default='100,1000,10000',
+                        help='comma separated node counts '
+                             '(default: %(default)s)')
+    render.add_argument('--zoom-levels', default='0,-4,-12',
+                        help='comma separated zoom steps '
+                             '(default: %(default)s)')
+    render.add_argument('--width', type=int, default=1280)
+    render.add_argument('--height', type=int, default=800)
+
+    for subparser in (scripts, render):
+        subparser.add_argument('-r', '--repeat', type=int, default=3,
+                               help='runs per case, of which the best '
+                                    'counts (default: %(default)s)')
+        subparser.add_argument('-o', '--output',
+                               help='JSON file to write the results to')
+
+    compare_parser = subparsers.add_parser(
+            'compare', help='show how two result files differ')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+
+    args = parser.parse_args(argv)
+
+    if args.mode == 'compare':
+        with open(args.old) as f:
+            args.old_mode = json.load(f)['mode']
+        compare(args)
+        return 0
+
+    if args.mode == 'scripts':
+        args.sizes = [parse_size(size) for size in args.sizes.split(',')]
+        args.shapes = args.shapes and args.shapes.split(',')
+        args.components = args.components and args.components.split(',')
+        results = bench_scripts(args)
+    elif args.mode == 'render':
+        args.nodes = [int(n) for n in args.nodes.split(',')]
+        args.zoom_levels = [int(n) for n in args.zoom_levels.split(',')]
+        results = bench_render(args)
+    else:
+        parser.print_help()
+        return 2
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'version': FORMAT_VERSION,
+                'mode': args.mode,
+                'time': time.time(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'results': results,
+            }, f, indent=2)
+    if any(result.get('matches') is False for result in results):
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,141 @@
+'''Keeps the outputs of components between runs, so that a rerun after an
+edit only runs the components that changed.
+
+Each output is keyed on a hash of its component's type and properties and
+the keys of the outputs it reads, so editing a component changes its key and
+the keys of everything downstream of it.  Components with no inputs, such
+as File Input, are keyed on what their get_signature returns, such as the
+names, sizes and modification times of their files, and so are components
+that read other files, such as the patterns file of a Filter.  A component
+with no inputs and no signature leaves everything downstream of it
+uncached.
+
+Entries are files in one directory, and once they add up to more than the
+size limit, the least recently used are removed.'''
+
+import os
+import json
+import hashlib
+import tempfile
+
+import graph
+
+# Part of every key, so that changing how outputs are stored or keyed
+# ignores old entries.
+VERSION = 1
+
+DEFAULT_SIZE = 10 << 30
+
+def default_directory():
+    base = (os.environ.get('XDG_CACHE_HOME')
+            or os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'plumber', 'results')
+
+def get_keys(components):
+    'Returns a dict of the key of every component whose outputs can be kept.'
+    # Components on a cycle are left out of the order, and get no key.
+    keys = {}
+    for component in graph.sort_components(components):
+        key = get_key(component, keys)
+        if key is not None:
+            keys[component] = key
+    return keys
+
+def get_key(component, keys):
+    'Returns the key of a component, given the keys of those before it.'
+    inputs = []
+    for pipe in component.input_pipes:
+        if pipe.start not in keys:
+            return None
+        inputs.append([keys[pipe.start], pipe.start.output_pipes.index(pipe)])
+
+    signature = component.get_signature()
+    if not component.inputs and signature is None:
+        return None
+
+    data = json.dumps([VERSION, component.name, component.get_properties(),
+                       inputs, signature], sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+class ResultCache(object):
+    'A directory of component outputs, at most about max_size bytes.'
+
+    def __init__(self, directory=None, max_size=DEFAULT_SIZE):
+        self.directory = directory or default_directory()
+        self.max_size = max_size
+
+    def get_path(self, key, port):
+        return os.path.join(self.directory, '{}.{}'.format(key, port))
+
+    def lookup(self, key, port):
+        'Returns the file holding an output, or None if it is not kept.'
+        path = self.get_path(key, port)
+        try:
+            # The modification time doubles as the time of last use.
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def create(self, key, port):
+        'Returns an Entry to write an output to.'
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        return Entry(self.get_path(key, port), self.directory)
+
+    def evict(self):
+        'Removes the least recently used entries until they fit.'
+        entries = []
+        for name in os.listdir(self.directory):
+            # Entries still being written start with a dot.
+            if name.startswith('.'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for mtime, size, path in entries)
+        for mtime, size, path in sorted(entries):
+            if total <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+class Entry(object):
+    '''An output being written to the cache.
+
+    It is written to a temporary file, and only replaces any entry with the
+    same key once committed, so a run that fails or is stopped leaves
+    nothing half written behind.'''
+
+    def __init__(self, path, directory):
+        self.path = path
+        fd, self.temp = tempfile.mkstemp(prefix='.', dir=directory)
+        self.file = os.fdopen(fd, 'w')
+
+    def write(self, line):
+        self.file.write(line)
+
+    def writelines(self, lines):
+        self.file.writelines(lines)
+
+    def commit(self):
+        self.file.close()
+        os.rename(self.temp, self.path)
+        self.temp = None
+
+    def discard(self):
+        if self.temp is None:
+            return
+        self.file.close()
+        try:
+            os.remove(self.temp)
+        except OSError:
+            pass
+        self.temp = None
@@ -0,0 +1,309 @@
+import re
+import sys
+import json
+import hashlib
+import argparse
+
+import graph
+from components import shell_quote
+
+# Each run keeps its FIFOs in a private directory, removed when it exits.
+WORKSPACE = '''
+workdir=$(mktemp -d "${TMPDIR:-/tmp}/plumber.XXXXXX") || exit 1
+trap 'rm -rf "$workdir"' EXIT
+trap 'kill $(jobs -p) 2> /dev/null; exit 1' HUP INT TERM
+'''
+
+# FIFOs are named after the position of the component that writes to them
+# in the graph, and its output port, so adding a component renames nothing.
+FIFO_NAME = '"$workdir/pipe_{}_{}"'
+
+# Input block size for components that run in parallel.
+PARALLEL_BLOCK = '1M'
+
+# File descriptors from here up carry a component's FIFOs.
+FIRST_FD = 3
+
+# Scripts are written out in blocks of about this many characters.
+WRITE_BUFFER = 1 << 16
+
+# Progress is reported after every this many components.
+PROGRESS_STEP = 500
+
+class CycleError(Exception): pass
+
+class ScriptWriter(object):
+    '''Gathers the many small pieces of a script and writes them to a file
+    in large blocks.'''
+
+    def __init__(self, f, size=WRITE_BUFFER):
+        self.f = f
+        self.size = size
+        self.parts = []
+        self.length = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.length += len(text)
+        if self.length >= self.size:
+            self.flush()
+
+    def flush(self):
+        self.f.write(''.join(self.parts))
+        self.parts = []
+        self.length = 0
+
+class CodeCache(object):
+    '''Remembers the code emitted for each configuration of a component.
+
+    Entries are keyed on the component type, its property values and its
+    signature, such as the patterns a Filter read from its file, so saving
+    a graph again only asks components that changed for their code.
+    Function names come from a hash of the same key, which keeps them the
+    same from one script to the next, and lets identical components share
+    one function.'''
+
+    def __init__(self):
+        self.commands = {}
+        self.functions = {}
+
+    @staticmethod
+    def get_key(component):
+        return (component.name,
+                json.dumps([component.get_properties(),
+                            component.get_signature()], sort_keys=True))
+
+    def get_command(self, component):
+        key = self.get_key(component)
+        try:
+            return self.commands[key]
+        except KeyError:
+            command = self.commands[key] = get_command(component)
+            return command
+
+    def get_function(self, component):
+        '''Returns the name of a component's shell function, and the code
+        that defines it.'''
+        key = self.get_key(component)
+        try:
+            return self.functions[key]
+        except KeyError:
+            pass
+
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        fname = '{}_{}'.format(re.sub('[^a-z0-9]+', '_',
+                                      component.name.lower()), digest[:8])
+        function = self.functions[key] = (
+                fname, component.get_function(fname + '()'))
+        return function
+
+def sort_components(components):
+    '''Orders components so that every producer comes before its consumers.
+
+    Raises CycleError if the pipes form a cycle.'''
+    order = graph.sort_components(components)
+    if len(order) != len(components):
+        ordered = set(order)
+        raise CycleError('Pipes form a cycle through: {}'.format(', '.join(
+                component.name for component in components
+                if component not in ordered)))
+    return order
+
+def write_script(f, components, cache=None, progress=None):
+    '''Writes a bash script that runs a graph of components to the file f.
+
+    Chains of components that have a shell command are joined into one
+    shell pipeline, and File Input and File Output components become plain
+    redirections.  Every other pipe gets its own FIFO, and each remaining
+    component is called with its inputs and then its outputs in port order.
+    Ports with no pipe attached read from or write to /dev/null.
+
+    Passing the same CodeCache to every call saves asking components that
+    have not changed for their code again.  progress, if given, is called
+    with the number of components written so far and the total.
+
+    The time taken grows linearly with the number of components and pipes.'''
+    if cache is None:
+        cache = CodeCache()
+    f = ScriptWriter(f)
+    order = sort_components(components)
+    index = dict((component, i) for i, component in enumerate(components))
+
+    commands = dict((component, cache.get_command(component))
+                    for component in order)
+
+    # Each pipe is either fused into a shell pipeline, or becomes a path:
+    # the file a source reads or a sink writes, or else a FIFO.
+    fused = set()
+    paths = {}
+    fifos = {}
+    copies = []
+    for component in order:
+        for port, pipe in enumerate(component.output_pipes):
+            source = pipe.start.get_source()
+            sink = pipe.end.get_sink()
+            if source is not None and sink is not None:
+                copies.append((shell_quote(source), shell_quote(sink)))
+            elif source is not None:
+                paths[pipe] = shell_quote(source)
+            elif sink is not None:
+                paths[pipe] = shell_quote(sink)
+            elif (commands[pipe.start] is not None
+                    and commands[pipe.end] is not None):
+                fused.add(pipe)
+            else:
+                fifos[pipe] = (index[pipe.start], port)
+                paths[pipe] = FIFO_NAME.format(*fifos[pipe])
+
+    f.write('#!/bin/bash\n')
+
+    launches = []
+    defined = set()
+    for n, component in enumerate(order):
+        if progress is not None and n % PROGRESS_STEP == 0:
+            progress(n, len(order))
+
+        if component.get_source() is not None:
+            continue
+        if component.get_sink() is not None:
+            continue
+
+        if commands[component] is None:
+            fname, function = cache.get_function(component)
+            if fname not in defined:
+                defined.add(fname)
+                f.write(function)
+                f.write('\n')
+            launches.append(launch_function(component, fname, paths, fifos))
+        elif not (component.input_pipes
+                  and component.input_pipes[0] in fused):
+            launches.append(launch_chain(component, commands, fused, paths,
+                                         fifos))
+
+    # One FIFO per line keeps diffs between scripts small.  They are listed
+    # in graph order, which is also the order of their names.
+    if fifos:
+        f.write(WORKSPACE)
+        f.write('mkfifo')
+        for component in components:
+            for pipe in component.output_pipes:
+                if pipe in fifos:
+                    f.write(' \\\n    ' + FIFO_NAME.format(*fifos[pipe]))
+        f.write('\n')
+    f.write('\n')
+
+    for source, sink in copies:
+        f.write('cat {} > {} &\n'.format(source, sink))
+
+    # Consumers start before their producers.
+    for launch in reversed(launches):
+        f.write(launch + ' &\n')
+
+    f.write('wait\n')
+    f.flush()
+
+    if progress is not None:
+        progress(len(order), len(order))
+
+# Opening a FIFO blocks until the other end is opened too, so every launch
+# line opens its FIFOs with redirections in FIFO name order.  With every
+# process opening in the same global order, no two can wait on each other,
+# whatever order the components themselves use.  The open FIFOs are handed
+# over through cat and process substitution rather than as /dev/fd paths:
+# on Linux opening /dev/fd/N opens the FIFO again, and blocks forever once
+# the other end has finished.  Files never block, so they are passed as
+# they are.
+
+PORT_COPY = {'<': '<(cat <&{})', '>': '>(cat >&{})'}
+
+def launch_function(component, fname, paths, fifos):
+    ports = ([(pipe, '<') for pipe in port_pipes(component.input_pipes,
+                                                 component.inputs)]
+             + [(pipe, '>') for pipe in port_pipes(component.output_pipes,
+                                                   component.outputs)])
+
+    args = [fname]
+    redirects = []
+    for fd, (pipe, direction) in enumerate(ports, FIRST_FD):
+        if pipe is None:
+            args.append('/dev/null')
+        elif pipe in fifos:
+            args.append(PORT_COPY[direction].format(fd))
+            redirects.append((fifos[pipe], fd, direction))
+        else:
+            args.append(paths[pipe])
+
+    if not redirects:
+        return ' '.join(args)
+    # The group's redirections are opened before its words are expanded.
+    redirects.sort()
+    return ' '.join(['{{ {}; }}'.format(' '.join(args))]
+                    + ['{}{}{}'.format(fd, direction, FIFO_NAME.format(*name))
+                       for name, fd, direction in redirects])
+
+def launch_chain(head, commands, fused, paths, fifos):
+    chain = [head]
+    while chain[-1].output_pipes and chain[-1].output_pipes[0] in fused:
+        chain.append(chain[-1].output_pipes[0].end)
+    tail = chain[-1]
+
+    redirects = []
+    if head.inputs:
+        pipe = port_pipes(head.input_pipes, 1)[0]
+        redirects.append((fifos.get(pipe, ()), 0, '<',
+                          paths[pipe] if pipe else '/dev/null'))
+    if tail.outputs:
+        pipe = port_pipes(tail.output_pipes, 1)[0]
+        redirects.append((fifos.get(pipe, ()), 1, '>',
+                          paths[pipe] if pipe else '/dev/null'))
+    redirects.sort()
+
+    pipeline = ' | '.join(commands[component] for component in chain)
+    if len(chain) > 1:
+        pipeline = '{{ {}; }}'.format(pipeline)
+    return ' '.join([pipeline] + ['{}{}{}'.format(fd, direction, path)
+                                  for n, fd, direction, path in redirects])
+
+def get_command(component):
+    command = component.get_command()
+    if command is None or not component.stateless:
+        return command
+    if component.parallelism <= 1:
+        return command
+
+    # GNU parallel cuts stdin into blocks on line boundaries, runs the
+    # command on each in up to N jobs, and writes each job's output whole.
+    return 'parallel --pipe --block {} -j {}{} {}'.format(
+            PARALLEL_BLOCK, component.parallelism,
+            ' --keep-order' if component.preserve_order else '',
+            shell_quote(command))
+
+def port_pipes(pipes, count):
+    return [pipes[i] if i < len(pipes) else None for i in range(count)]
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+            prog='plumber compile',
+            description='Compiles a saved graph into a bash script.')
+    parser.add_argument('graph', help='graph file to compile')
+    parser.add_argument('-o', '--output', default='-',
+                        help='script file to write (default: stdout)')
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.graph) as f:
+            components, positions = graph.load(f)
+    except (IOError, graph.GraphFormatError) as e:
+        sys.stderr.write('plumber: {}\n'.format(e))
+        return 1
+
+    try:
+        if args.output == '-':
+            write_script(sys.stdout, components)
+        else:
+            with open(args.output, 'w') as f:
+                write_script(f, components)
+    except CycleError as e:
+        sys.stderr.write('plumber: {}\n'.format(e))
+        return 1
+    return 0
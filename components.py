@@ -1,10 +1,83 @@
+from __future__ import division
+
+import os
+import itertools
+import operator
 import re
 
-from gi.repository import Gtk
+try:
+    from itertools import izip as zip
+except ImportError:
+    pass
+
+try:
+    from shlex import quote as shell_quote
+except ImportError:
+    from pipes import quote as shell_quote
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+import extsort
+import fileio
 
 class FullPipeError(Exception): pass
 
+class Pipe(object):
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+
+        try:
+            self.start.attach_output(self)
+            self.end.attach_input(self)
+        except FullPipeError:
+            self.detach()
+            raise
+
+    def detach(self):
+        try:
+            self.start.detach_output(self)
+            self.end.detach_input(self)
+        except ValueError:
+            pass
+
+def _check_type(name, default, value):
+    # Properties that default to None hold paths or other text.
+    if default is None:
+        valid = value is None or isinstance(value, string_types)
+        kind = 'text'
+    elif isinstance(default, string_types):
+        valid = isinstance(value, string_types)
+        kind = 'text'
+    elif isinstance(default, bool):
+        valid = isinstance(value, bool)
+        kind = 'true or false'
+    elif isinstance(default, int):
+        valid = isinstance(value, int) and not isinstance(value, bool)
+        kind = 'a whole number'
+    elif isinstance(default, float):
+        valid = (isinstance(value, (int, float))
+                 and not isinstance(value, bool))
+        kind = 'a number'
+    elif isinstance(default, list):
+        valid = (isinstance(value, list)
+                 and all(isinstance(v, string_types) for v in value))
+        kind = 'a list of text'
+    else:
+        valid = True
+    if not valid:
+        raise TypeError('{} must be {}'.format(name, kind))
+
 class Component(object):
+    # Names of the attributes saved with a graph.
+    properties = ()
+
+    # Stateless components can have their input split across workers.
+    stateless = False
+
     def __init__(self):
         self.input_pipes = []
         self.output_pipes = []
@@ -30,17 +103,279 @@ class Component(object):
     def init_properties(self, builder):
         pass
 
+    def get_properties(self):
+        return dict((name, getattr(self, name)) for name in self.properties)
+
+    def set_properties(self, properties):
+        '''Sets properties from a dict, such as one read from a graph file.
+
+        Raises TypeError if a value is not of the type of the property's
+        default, and ValueError if check_properties finds one out of
+        range.'''
+        for name in self.properties:
+            if name in properties:
+                _check_type(name, getattr(self, name), properties[name])
+                setattr(self, name, properties[name])
+        self.check_properties()
+
+    def check_properties(self):
+        'Raises ValueError if a property is out of range.'
+
+    def check_range(self, name, lower, upper=None):
+        value = getattr(self, name)
+        if upper is None and value < lower:
+            raise ValueError('{} must be at least {}'.format(name, lower))
+        if upper is not None and not lower <= value <= upper:
+            raise ValueError('{} must be from {} to {}'.format(
+                    name, lower, upper))
+
+    def check_choice(self, name, choices):
+        if getattr(self, name) not in choices:
+            raise ValueError('{} must be one of {}'.format(
+                    name, ', '.join(sorted(choices))))
+
+    def get_command(self):
+        '''Returns a shell command that reads stdin and writes stdout.
+
+        Components with one input and one output can return one, and the
+        compiler joins chains of them into a single shell pipeline.  A
+        component with no inputs can return one that only writes stdout,
+        and one with no outputs one that only reads stdin, to start or end
+        a chain.  A pipeline of several commands must be grouped in braces,
+        so that redirections apply to all of it.'''
+        return None
+
+    def get_source(self):
+        'Returns the file a component only copies to its output, if any.'
+        return None
+
+    def get_sink(self):
+        'Returns the file a component only copies its input to, if any.'
+        return None
+
+    def get_signature(self):
+        '''Returns what identifies the data a component reads from outside
+        the graph, as a JSON value, or None.
+
+        The result cache only keeps the outputs downstream of a component
+        with no inputs if it has a signature.  Any component that reads
+        files besides its inputs must return one that changes with them.'''
+        return None
+
     def get_function(self, fname):
-        return ''
+        command = self.get_command()
+        if command is None:
+            return ''
+        ports = ['<'] * self.inputs + ['>'] * self.outputs
+        return '''
+function {} {{
+    {} {}
+}}'''.format(fname, command, ' '.join(
+                '{} "${}"'.format(direction, i)
+                for i, direction in enumerate(ports, 1)))
+
+    def run(self, inputs, outputs):
+        raise NotImplementedError('{} cannot run in-process'.format(self.name))
+
+    def __getstate__(self):
+        # Worker processes get a component's settings, not the whole graph.
+        state = self.__dict__.copy()
+        state['input_pipes'] = []
+        state['output_pipes'] = []
+        return state
+
+# Properties dialog rows shared by every StatelessComponent.  The adjustment
+# goes at the top level of the interface, the rows inside properties_box.
+PARALLEL_ADJUSTMENT = '''
+            <object class="GtkAdjustment" id="parallelism_adjustment">
+                <property name="lower">1</property>
+                <property name="upper">64</property>
+                <property name="step_increment">1</property>
+            </object>'''
+
+PARALLEL_PROPERTIES = '''
+                <child>
+                    <object class="GtkBox" id="parallelism_box">
+                        <child><object class="GtkLabel" id="parallelism_label">
+                            <property name="label">Parallelism</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkSpinButton" id="parallelism_spin">
+                                <property name="adjustment">parallelism_adjustment</property>
+                                <signal name="value-changed" handler="set_parallelism"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>
+                <child>
+                    <object class="GtkCheckButton" id="preserve_order_check">
+                        <property name="label">Preserve order</property>
+                        <signal name="toggled" handler="set_preserve_order"/>
+                    </object>
+                </child>'''
+
+class StatelessComponent(Component):
+    '''A component whose output for a line depends on that line alone.
+
+    Subclasses implement process_chunk, and with a parallelism above 1 the
+    runtime and the compiler shard the input by blocks of lines across that
+    many workers, merging their outputs in order if preserve_order is set.'''
+
+    stateless = True
+
+    properties = ('parallelism', 'preserve_order')
+
+    def __init__(self):
+        super(StatelessComponent, self).__init__()
+        self.parallelism = 1
+        self.preserve_order = True
+
+    def check_properties(self):
+        self.check_range('parallelism', 1)
+
+    def init_properties(self, builder):
+        builder.get_object('parallelism_spin').set_value(self.parallelism)
+        builder.get_object('preserve_order_check').set_active(
+                self.preserve_order)
+
+    def set_parallelism(self, spin_button):
+        self.parallelism = spin_button.get_value_as_int()
+
+    def set_preserve_order(self, check_button):
+        self.preserve_order = check_button.get_active()
+
+    def process_chunk(self, lines):
+        'Returns the list of lines to write to each output.'
+        raise NotImplementedError('Implement this!')
+
+    def run(self, inputs, outputs):
+        for chunk in inputs[0].chunks():
+            for output, lines in zip(outputs, self.process_chunk(chunk)):
+                output.write_chunk(lines)
+
+# The leading number awk reads from a field when adding 0 to it.
+_NUMBER = re.compile(r'\s*([-+]?)(\d*)(\.\d*)?([eE][-+]?\d+)?')
+
+def _parse_number(text):
+    '''Returns the number text starts with, or 0 if it does not start with
+    one, as awk does for "$1 + 0".'''
+    match = _NUMBER.match(text)
+    sign, whole, fraction, exponent = match.groups()
+    if not whole and (not fraction or fraction == '.'):
+        return 0
+    if fraction is None and exponent is None:
+        return int(sign + whole)
+    return float(sign + whole + (fraction or '') + (exponent or ''))
+
+def _format_number(value):
+    if isinstance(value, float):
+        return '{:.15g}\n'.format(value)
+    return '{}\n'.format(value)
+
+# Properties dialog rows shared by File Input and File Output, placed like
+# PARALLEL_ADJUSTMENT and PARALLEL_PROPERTIES.
+CODEC_ADJUSTMENT = '''
+            <object class="GtkAdjustment" id="threads_adjustment">
+                <property name="lower">1</property>
+                <property name="upper">64</property>
+                <property name="step_increment">1</property>
+            </object>'''
+
+CODEC_PROPERTIES = '''
+                <child>
+                    <object class="GtkBox" id="compression_box">
+                        <child><object class="GtkLabel" id="compression_label">
+                            <property name="label">Compression</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkComboBoxText" id="compression_combo">
+                                <items>
+                                    <item id="auto">From file name</item>
+                                    <item id="none">None</item>
+                                    <item id="gzip">gzip</item>
+                                    <item id="zstd">zstd</item>
+                                </items>
+                                <signal name="changed" handler="set_compression"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>
+                <child>
+                    <object class="GtkBox" id="threads_box">
+                        <child><object class="GtkLabel" id="threads_label">
+                            <property name="label">Codec threads</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkSpinButton" id="threads_spin">
+                                <property name="adjustment">threads_adjustment</property>
+                                <signal name="value-changed" handler="set_threads"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>'''
+
+class FileComponent(Component):
+    '''A component that reads or writes files.
+
+    Files can be gzip or zstd compressed, which by default is told from
+    the file name.  Compressing with more than one thread uses pigz for
+    gzip, which then has to be installed.'''
+
+    properties = ('compression', 'threads')
+
+    def __init__(self):
+        super(FileComponent, self).__init__()
+        self.compression = 'auto'
+        self.threads = 1
+
+    def check_properties(self):
+        self.check_choice('compression', fileio.COMPRESSIONS)
+        self.check_range('threads', 1)
+
+    def init_properties(self, builder):
+        builder.get_object('compression_combo').set_active_id(
+                self.compression)
+        builder.get_object('threads_spin').set_value(self.threads)
+
+    def set_compression(self, combo_box):
+        self.compression = combo_box.get_active_id()
+
+    def set_threads(self, spin_button):
+        self.threads = spin_button.get_value_as_int()
+
+    def get_codec(self):
+        return fileio.get_codec(self.compression, self.get_path())
+
+class FileInputComponent(FileComponent):
+    '''Reads a file, or every file a glob pattern matches, one after
+    another.
+
+    Running in-process, plain files are memory mapped and read_ahead
+    kilobytes are read at a time.'''
 
-class FileInputComponent(Component):
     name = 'File Input'
     category = 'I/O'
     inputs = 0
     outputs = 1
 
+    properties = ('input_file', 'read_ahead') + FileComponent.properties
+
     properties_dialog = '''
-        <interface>
+        <interface>''' + CODEC_ADJUSTMENT + '''
+            <object class="GtkAdjustment" id="read_ahead_adjustment">
+                <property name="lower">64</property>
+                <property name="upper">1048576</property>
+                <property name="step_increment">64</property>
+            </object>
             <object class="GtkBox" id="properties_box">
                 <property name="orientation">vertical</property>
                 <child>
@@ -59,35 +394,119 @@ class FileInputComponent(Component):
                         </child>
                     </object>
                 </child>
+                <child>
+                    <object class="GtkBox" id="pattern_box">
+                        <child><object class="GtkLabel" id="pattern_label">
+                            <property name="label">Or Pattern:</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkEntry" id="pattern_entry">
+                                <signal name="changed" handler="set_input_pattern"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>''' + CODEC_PROPERTIES + '''
+                <child>
+                    <object class="GtkBox" id="read_ahead_box">
+                        <child><object class="GtkLabel" id="read_ahead_label">
+                            <property name="label">Read ahead (KB)</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkSpinButton" id="read_ahead_spin">
+                                <property name="adjustment">read_ahead_adjustment</property>
+                                <signal name="value-changed" handler="set_read_ahead"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>
             </object>
         </interface>'''
 
     def __init__(self):
         super(FileInputComponent, self).__init__()
         self.input_file = None
+        self.read_ahead = fileio.READ_AHEAD >> 10
+
+    def check_properties(self):
+        super(FileInputComponent, self).check_properties()
+        self.check_range('read_ahead', 1)
 
     def init_properties(self, builder):
-        if self.input_file:
-            file_chooser = builder.get_object('filechooser1')
+        super(FileInputComponent, self).init_properties(builder)
+        file_chooser = builder.get_object('filechooser1')
+        pattern = self.input_file and fileio.has_pattern(self.input_file)
+        if self.input_file and not pattern:
             file_chooser.set_filename(self.input_file)
+        else:
+            file_chooser.unselect_all()
+        builder.get_object('pattern_entry').set_text(
+                self.input_file if pattern else '')
+        builder.get_object('read_ahead_spin').set_value(self.read_ahead)
 
     def set_input_file(self, file_chooser):
         self.input_file = file_chooser.get_filename()
 
-    def get_function(self, fname):
-        return '''
-function {} {{
-    cat {} > $1
-}}'''.format(fname, self.input_file)
+    def set_input_pattern(self, entry):
+        if entry.get_text():
+            self.input_file = entry.get_text()
+
+    def set_read_ahead(self, spin_button):
+        self.read_ahead = spin_button.get_value_as_int()
+
+    def get_path(self):
+        return self.input_file
+
+    def get_source(self):
+        if self.get_codec() is not None:
+            return None
+        if self.input_file and fileio.has_pattern(self.input_file):
+            return None
+        return self.input_file
+
+    def get_signature(self):
+        # Files are told apart by name, size and modification time, rather
+        # than reading them all to hash their contents.
+        if not self.input_file:
+            return None
+        try:
+            paths = fileio.expand(self.input_file)
+            stats = [os.stat(path) for path in paths]
+        except (IOError, OSError):
+            return None
+        return [[path, stat.st_size, stat.st_mtime]
+                for path, stat in zip(paths, stats)]
 
-class FileOutputComponent(Component):
+    def get_command(self):
+        # Only used when there is no single plain file to redirect from.
+        files = fileio.quote_pattern(self.input_file or '')
+        codec = self.get_codec()
+        if codec is None:
+            return 'cat ' + files
+        return ' '.join(fileio.decompress_command(codec, self.threads) +
+                        [files])
+
+    def run(self, inputs, outputs):
+        paths = fileio.expand(self.input_file)
+        for lines in fileio.read_files(paths, self.get_codec(), self.threads,
+                                       self.read_ahead << 10):
+            outputs[0].write_chunk(lines)
+
+class FileOutputComponent(FileComponent):
     name = 'File Output'
     category = 'I/O'
     inputs = 1
     outputs = 0
 
+    properties = ('output_file',) + FileComponent.properties
+
     properties_dialog = '''
-        <interface>
+        <interface>''' + CODEC_ADJUSTMENT + '''
             <object class="GtkBox" id="properties_box">
                 <property name="orientation">vertical</property>
                 <child>
@@ -105,7 +524,7 @@ class FileOutputComponent(Component):
                             </packing>
                         </child>
                     </object>
-                </child>
+                </child>''' + CODEC_PROPERTIES + '''
             </object>
         </interface>'''
 
@@ -114,76 +533,347 @@ class FileOutputComponent(Component):
         self.output_file = None
 
     def init_properties(self, builder):
+        super(FileOutputComponent, self).init_properties(builder)
         file_chooser = builder.get_object('filechooser1')
         if self.output_file:
             file_chooser.set_filename(self.output_file)
+        else:
+            file_chooser.unselect_all()
 
     def set_output_file(self, file_chooser):
         self.output_file = file_chooser.get_filename()
 
-    def get_function(self, fname):
-        return '''
-function {} {{
-    cat $1 > {}
-}}'''.format(fname, self.output_file)
+    def get_path(self):
+        return self.output_file
+
+    def get_sink(self):
+        if self.get_codec() is not None:
+            return None
+        return self.output_file
+
+    def get_command(self):
+        codec = self.get_codec()
+        command = ('cat' if codec is None else
+                   ' '.join(fileio.compress_command(codec, self.threads)))
+        return '{} > {}'.format(command, shell_quote(self.output_file or ''))
+
+    def run(self, inputs, outputs):
+        fileio.write_file(self.output_file, inputs[0].chunks(),
+                          self.get_codec(), self.threads)
+
+# Escapes that mean the same to grep -E as to Python and PCRE.  Any other
+# backslash followed by a letter or digit needs grep -P.
+_ERE_ESCAPES = set('wWsSbB')
+
+_REGEX_CHARS = set('.^$*+?()[]{}|\\')
+
+def _is_literal(pattern):
+    return not any(c in _REGEX_CHARS for c in pattern)
+
+def _needs_pcre(pattern):
+    if '(?' in pattern or re.search(r'[*+?}][?+]', pattern):
+        return True
+    # A backslash inside a bracket expression is literal to grep -E.
+    if '[' in pattern and '\\' in pattern:
+        return True
+    for match in re.finditer(r'\\(.)', pattern):
+        c = match.group(1)
+        if c.isalnum() and c not in _ERE_ESCAPES:
+            return True
+    return False
+
+# Matches nothing, for a Filter whose patterns file is empty.
+_NO_MATCH = re.compile(r'(?!)')
+
+# What POSIX classes, which grep understands inside bracket expressions,
+# stand for in the C locale.
+_POSIX_CLASSES = {
+    'alpha': 'A-Za-z',
+    'digit': '0-9',
+    'alnum': '0-9A-Za-z',
+    'upper': 'A-Z',
+    'lower': 'a-z',
+    'xdigit': '0-9A-Fa-f',
+    'space': ' \\t\\n\\r\\f\\v',
+    'blank': ' \\t',
+    'punct': ''.join('\\' + c for c in '!"#$%&\'()*+,-./:;<=>?@[\\]^_`{|}~'),
+    'cntrl': '\\x00-\\x1f\\x7f',
+    'print': '\\x20-\\x7e',
+    'graph': '\\x21-\\x7e',
+}
+
+def _translate_classes(pattern):
+    '''Rewrites POSIX classes such as [:digit:] inside bracket expressions
+    as ranges, which Python understands.
+
+    Raises re.error for an unknown class, as grep rejects them.'''
+    if '[:' not in pattern:
+        return pattern
+
+    parts = []
+    bracket = False
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == '\\':
+            parts.append(pattern[i:i + 2])
+            i += 2
+            continue
+        if not bracket:
+            parts.append(c)
+            i += 1
+            if c == '[':
+                bracket = True
+                # A ] straight after [ or [^ is part of the set.
+                for prefix in ('^', ']'):
+                    if pattern.startswith(prefix, i):
+                        parts.append(prefix)
+                        i += 1
+            continue
+        if pattern.startswith('[:', i):
+            end = pattern.find(':]', i + 2)
+            if end != -1:
+                name = pattern[i + 2:end]
+                if name not in _POSIX_CLASSES:
+                    raise re.error('invalid character class: ' + name)
+                parts.append(_POSIX_CLASSES[name])
+                i = end + 2
+                continue
+        if c == ']':
+            bracket = False
+        parts.append(c)
+        i += 1
+    return ''.join(parts)
+
+def _read_patterns(path):
+    '''Returns the patterns in a file, one per line, skipping blank lines,
+    or None if there is no file.
+
+    Raises IOError if the file cannot be read.'''
+    if not path:
+        return None
+    with open(path) as f:
+        return [p for p in f.read().split('\n') if p]
+
+# Inline flags, such as (?i), which Python only accepts at the start of a
+# regex.
+_GLOBAL_FLAGS = re.compile(r'\(\?([aiLmsux]+)\)')
+
+def _join_patterns(patterns):
+    '''Joins patterns into one regex that matches wherever any of them does.
+
+    Flags at the start of a pattern apply to that pattern alone.'''
+    if len(patterns) == 1:
+        return patterns[0]
 
-class FilterComponent(Component):
+    parts = []
+    for pattern in patterns:
+        flags = ''
+        match = _GLOBAL_FLAGS.match(pattern)
+        while match:
+            flags += match.group(1)
+            pattern = pattern[match.end():]
+            match = _GLOBAL_FLAGS.match(pattern)
+        parts.append('(?{}:{})'.format(flags, pattern))
+    return '|'.join(parts)
+
+class FilterComponent(StatelessComponent):
     name = 'Filter'
     category = 'Searching'
     inputs = 1
     outputs = 1
 
+    properties = StatelessComponent.properties + ('patterns', 'patterns_file')
+
     properties_dialog = '''
-        <interface>
+        <interface>''' + PARALLEL_ADJUSTMENT + '''
+            <object class="GtkTextBuffer" id="textbuffer1">
+                <signal name="changed" handler="set_patterns"/>
+            </object>
             <object class="GtkBox" id="properties_box">
                 <property name="orientation">vertical</property>
                 <child>
-                    <object class="GtkBox" id="box1">
-                        <child><object class="GtkLabel" id="label1">
-                            <property name="label">Regular Expression</property>
+                    <object class="GtkLabel" id="label1">
+                        <property name="label">Regular Expressions (one per line, any may match)</property>
+                        <property name="xalign">0</property>
+                    </object>
+                </child>
+                <child>
+                    <object class="GtkTextView" id="textview1">
+                        <property name="buffer">textbuffer1</property>
+                        <property name="height_request">80</property>
+                    </object>
+                    <packing>
+                        <property name="expand">True</property>
+                    </packing>
+                </child>
+                <child>
+                    <object class="GtkBox" id="box2">
+                        <child><object class="GtkLabel" id="label2">
+                            <property name="label">Patterns File:</property>
                         </object></child>
                         <child>
-                            <object class="GtkEntry" id="entry1">
-                                <signal name="changed" handler="set_regex"/>
+                            <object class="GtkFileChooserButton" id="filechooser1">
+                                <property name="title">Patterns File</property>
+                                <signal name="file-set" handler="set_patterns_file"/>
                             </object>
                             <packing>
                                 <property name="expand">True</property>
                             </packing>
                         </child>
                     </object>
-                </child>
+                </child>''' + PARALLEL_PROPERTIES + '''
             </object>
         </interface>'''
 
     def __init__(self):
         super(FilterComponent, self).__init__()
+        self.patterns = []
+        self.patterns_file = None
+        self.file_patterns = None
         self.regex = None
+        self.literal = None
 
     def init_properties(self, builder):
-        entry = builder.get_object('entry1')
-        if self.regex:
-            entry.set_text(self.regex.pattern)
+        super(FilterComponent, self).init_properties(builder)
+        builder.get_object('textbuffer1').set_text('\n'.join(self.patterns))
+        file_chooser = builder.get_object('filechooser1')
+        if self.patterns_file:
+            file_chooser.set_filename(self.patterns_file)
+        else:
+            file_chooser.unselect_all()
 
-    def set_regex(self, entry):
+    def set_patterns(self, text_buffer):
+        text = text_buffer.get_text(text_buffer.get_start_iter(),
+                                    text_buffer.get_end_iter(), False)
         try:
-            self.regex = re.compile(entry.get_text())
+            self.compile([p for p in text.split('\n') if p],
+                         self.file_patterns)
         except re.error:
             pass
 
-    def get_function(self, fname):
-        return '''
-function {} {{
-    grep -Pe \'{}\' $1 > $2
-}}'''.format(fname, self.regex.pattern)
+    def set_patterns_file(self, file_chooser):
+        # A file that cannot be read, or holds an invalid pattern, is not
+        # taken up.
+        try:
+            self.compile(self.patterns,
+                         _read_patterns(file_chooser.get_filename()))
+        except (IOError, re.error):
+            if self.patterns_file:
+                file_chooser.set_filename(self.patterns_file)
+            else:
+                file_chooser.unselect_all()
+            return
+        self.patterns_file = file_chooser.get_filename()
+
+    def set_properties(self, properties):
+        super(FilterComponent, self).set_properties(properties)
+        # Graphs saved before multi-pattern filters had a single regex.
+        if properties.get('regex') is not None:
+            self.patterns = [properties['regex']]
+        self.load_patterns_file()
+
+    def load_patterns_file(self):
+        self.compile(self.patterns, _read_patterns(self.patterns_file))
+
+    def compile(self, patterns, file_patterns):
+        '''Builds the matcher for a set of patterns, and those read from the
+        patterns file, or None without one.
+
+        A Filter with neither passes every line, but one whose patterns
+        file holds none passes no line, as grep -f does.  Raises re.error,
+        leaving the current matcher alone, if any pattern is invalid.'''
+        all_patterns = patterns + (file_patterns or [])
+        regex = literal = None
+        if not all_patterns and file_patterns is not None:
+            regex = _NO_MATCH
+        elif len(all_patterns) == 1 and _is_literal(all_patterns[0]):
+            literal = all_patterns[0]
+        elif all_patterns:
+            regex = re.compile(_join_patterns(
+                    [_translate_classes(p) for p in all_patterns]))
+
+        self.patterns = patterns
+        self.file_patterns = file_patterns
+        self.regex = regex
+        self.literal = literal
+
+    def get_command(self):
+        patterns = self.patterns + (self.file_patterns or [])
+        if not patterns:
+            if self.file_patterns is not None:
+                return 'sed d'
+            return 'cat'
 
-class SplitComponent(Component):
+        # grep -P accepts only a single pattern, so join alternatives into
+        # one.  The other modes take any number.
+        if any(_needs_pcre(p) for p in patterns):
+            return 'grep -P -e {}'.format(shell_quote(
+                    _join_patterns(patterns)))
+
+        if all(_is_literal(p) for p in patterns):
+            args = ['grep', '-F']
+        else:
+            args = ['grep', '-E']
+        # Patterns from the file are passed as they were read, without its
+        # blank lines, which grep -f would take as matching every line.
+        for pattern in patterns:
+            args.extend(['-e', shell_quote(pattern)])
+        return ' '.join(args)
+
+    def get_signature(self):
+        # The patterns read from the file, which change when it does.
+        if not self.patterns_file:
+            return None
+        return self.file_patterns
+
+    def process_chunk(self, lines):
+        if self.literal is not None:
+            literal = self.literal
+            return [[line for line in lines if literal in line]]
+        if self.regex is None:
+            return [lines]
+
+        # grep never sees the newline, so neither does the regex.
+        search = self.regex.search
+        return [[line for line in lines
+                 if search(line, 0, len(line) - line.endswith('\n'))]]
+
+# Characters that cannot go inside a bracket expression as they are, and
+# how a separator matches them, escaped once more for -F.
+_AWK_ESCAPES = {
+    '\\': '\\\\\\\\',
+    '^': '\\\\^',
+}
+
+def _awk_separator(delim):
+    '''Returns the awk -F argument that splits on each delim literally.
+
+    awk takes a single space to mean runs of blanks, t to mean a tab in
+    some versions, and longer separators as regular expressions, so those
+    become a regular expression of one bracket expression per character.'''
+    if len(delim) == 1 and delim not in ' t\\':
+        return delim
+    return ''.join(_AWK_ESCAPES.get(c, '[' + c + ']') for c in delim)
+
+class SplitComponent(StatelessComponent):
     name = 'Split'
     category = 'Editing'
     inputs = 1
     outputs = 2
 
+    MIN_OUTPUTS = 2
+    MAX_OUTPUTS = 16
+
+    properties = StatelessComponent.properties + ('delim', 'outputs')
+
     properties_dialog = '''
-        <interface>
+        <interface>''' + PARALLEL_ADJUSTMENT + '''
+            <object class="GtkAdjustment" id="adjustment1">
+                <property name="lower">2</property>
+                <property name="upper">16</property>
+                <property name="step_increment">1</property>
+            </object>
             <object class="GtkBox" id="properties_box">
                 <property name="orientation">vertical</property>
                 <child>
@@ -201,46 +891,598 @@ class SplitComponent(Component):
                         </child>
                     </object>
                 </child>
+                <child>
+                    <object class="GtkBox" id="box2">
+                        <child><object class="GtkLabel" id="label2">
+                            <property name="label">Outputs</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkSpinButton" id="spinbutton1">
+                                <property name="adjustment">adjustment1</property>
+                                <signal name="value-changed" handler="set_outputs"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>''' + PARALLEL_PROPERTIES + '''
             </object>
         </interface>'''
 
     def __init__(self):
         super(SplitComponent, self).__init__()
         self.delim = None
+        self.outputs = SplitComponent.outputs
+
+    def check_properties(self):
+        super(SplitComponent, self).check_properties()
+        self.check_range('outputs', self.MIN_OUTPUTS, self.MAX_OUTPUTS)
 
     def init_properties(self, builder):
-        entry = builder.get_object('entry1')
-        if self.delim:
-            entry.set_text(self.delim)
+        super(SplitComponent, self).init_properties(builder)
+        builder.get_object('entry1').set_text(self.delim or '')
+
+        # Ports that already have a pipe attached cannot be removed.
+        adjustment = builder.get_object('adjustment1')
+        adjustment.set_lower(max(self.MIN_OUTPUTS, len(self.output_pipes)))
+        adjustment.set_upper(self.MAX_OUTPUTS)
+        builder.get_object('spinbutton1').set_value(self.outputs)
 
     def set_delim(self, entry):
         self.delim = entry.get_text()
 
+    def set_outputs(self, spin_button):
+        # Even with the lower bound set, a spin button can pass on a value
+        # typed below it, which would orphan the pipes on the ports beyond.
+        outputs = max(spin_button.get_value_as_int(), self.MIN_OUTPUTS,
+                      len(self.output_pipes))
+        self.outputs = outputs
+        if spin_button.get_value_as_int() != outputs:
+            spin_button.set_value(outputs)
+
     def get_function(self, fname):
+        # A single awk pass writes field N to the file named by output N.
+        outputs = ' '.join('-v o{0}="${1}"'.format(i, i + 1)
+                           for i in range(1, self.outputs + 1))
+        prints = '; '.join('print ${0} > o{0}'.format(i)
+                           for i in range(1, self.outputs + 1))
+        separator = ('-F {} '.format(shell_quote(_awk_separator(self.delim)))
+                     if self.delim else '')
+
         return '''
 function {fname} {{
-    while read line; do
-        echo $line | awk -F \'{delim}\' \'{{print $1}}\'
-        echo $line | awk -F \'{delim}\' \'{{print $2}}\' >&2
-    done < $1 > $2 2> $3
-}}'''.format(fname=fname, delim=self.delim)
+    awk {separator}{outputs} \'{{ {prints} }}\' "$1"
+}}'''.format(fname=fname, separator=separator, outputs=outputs,
+                prints=prints)
 
-class AddComponent(Component):
-    name = 'Add'
+    def process_chunk(self, lines):
+        delim = self.delim
+        count = self.outputs
+        padding = [''] * count
+
+        columns = [[] for i in range(count)]
+        for line in lines:
+            if delim:
+                fields = line.rstrip('\n').split(delim, count)
+            else:
+                fields = line.split(None, count)
+            fields.extend(padding)
+            for column, field in zip(columns, fields):
+                column.append(field + '\n')
+        return columns
+
+class ArithmeticComponent(Component):
     category = 'Calculations'
     inputs = 2
     outputs = 1
 
     properties_dialog = None
 
+    # Set by subclasses: the awk operator and the equivalent Python function.
+    symbol = None
+    operation = None
+
     def get_function(self, fname):
+        # One awk process reads the first input and pulls the matching line
+        # of the second with getline, rather than one bc process per line.
         return '''
-function {} {{
-    while read x <&3; do
-        read y <&4
-        echo $x + $y | bc
-    done 3< $1 4< $2 > $3
-}}'''.format(fname)
+function {fname} {{
+    awk -v OFMT=%.15g -v second="$2" \'{{ if ((getline y < second) <= 0) exit; print $1 {symbol} y }}\' "$1" > "$3"
+}}'''.format(fname=fname, symbol=self.symbol)
+
+    def run(self, inputs, outputs):
+        operation = self.operation
+        write = outputs[0].write
+        for x, y in zip(inputs[0], inputs[1]):
+            write(_format_number(operation(_parse_number(x),
+                                           _parse_number(y))))
+
+class AddComponent(ArithmeticComponent):
+    name = 'Add'
+    symbol = '+'
+    operation = operator.add
+
+class SubtractComponent(ArithmeticComponent):
+    name = 'Subtract'
+    symbol = '-'
+    operation = operator.sub
+
+class MultiplyComponent(ArithmeticComponent):
+    name = 'Multiply'
+    symbol = '*'
+    operation = operator.mul
+
+class AggregateComponent(Component):
+    category = 'Calculations'
+    inputs = 1
+    outputs = 1
+
+    properties_dialog = None
+
+    # Set by subclasses: the awk END expression, given the sum s and count n.
+    expression = None
+
+    def get_command(self):
+        return ('awk -v OFMT=%.15g \'{{ s += $1; n++ }} '
+                'END {{ if (n) print {} }}\''.format(self.expression))
+
+    def run(self, inputs, outputs):
+        total = 0
+        count = 0
+        for chunk in inputs[0].chunks():
+            total += sum(_parse_number(line) for line in chunk)
+            count += len(chunk)
+
+        if count:
+            outputs[0].write(_format_number(self.aggregate(total, count)))
+
+class SumComponent(AggregateComponent):
+    name = 'Sum'
+    expression = 's + 0'
+
+    def aggregate(self, total, count):
+        return total
+
+class MeanComponent(AggregateComponent):
+    name = 'Mean'
+    expression = 's / n'
+
+    def aggregate(self, total, count):
+        return total / count
+
+# Properties dialog rows shared by every SortingComponent, placed like
+# PARALLEL_ADJUSTMENT and PARALLEL_PROPERTIES.
+MEMORY_ADJUSTMENT = '''
+            <object class="GtkAdjustment" id="memory_adjustment">
+                <property name="lower">16</property>
+                <property name="upper">1048576</property>
+                <property name="step_increment">64</property>
+            </object>''' + PARALLEL_ADJUSTMENT
+
+MEMORY_PROPERTIES = '''
+                <child>
+                    <object class="GtkBox" id="memory_box">
+                        <child><object class="GtkLabel" id="memory_label">
+                            <property name="label">Memory (MB)</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkSpinButton" id="memory_spin">
+                                <property name="adjustment">memory_adjustment</property>
+                                <signal name="value-changed" handler="set_memory"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>
+                <child>
+                    <object class="GtkBox" id="parallelism_box">
+                        <child><object class="GtkLabel" id="parallelism_label">
+                            <property name="label">Parallelism</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkSpinButton" id="parallelism_spin">
+                                <property name="adjustment">parallelism_adjustment</property>
+                                <signal name="value-changed" handler="set_parallelism"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>'''
+
+def _key_options(field, delim):
+    'Returns the sort options that compare lines by one field.'
+    if not field:
+        return []
+    if delim:
+        return ['-t', shell_quote(delim), '-k', '{0},{0}'.format(field)]
+    return ['-b', '-k', '{0},{0}'.format(field)]
+
+class SortingComponent(Component):
+    '''A component that has to sort its whole input.
+
+    Runs of at most memory megabytes are sorted and spilled to temporary
+    files, then merged, so the input can be far larger than memory, and
+    parallelism runs are sorted at once.  Compiled scripts leave this to
+    GNU sort, in the C locale so that lines order as they do in Python.'''
+
+    inputs = 1
+    outputs = 1
+
+    properties = ('memory', 'parallelism')
+
+    def __init__(self):
+        super(SortingComponent, self).__init__()
+        self.memory = 256
+        self.parallelism = 1
+
+    def check_properties(self):
+        self.check_range('memory', 1)
+        self.check_range('parallelism', 1)
+
+    def check_delim(self):
+        # sort -t takes a single character.
+        if len(self.delim) > 1:
+            raise ValueError('delim must be a single character')
+
+    def init_properties(self, builder):
+        builder.get_object('memory_spin').set_value(self.memory)
+        builder.get_object('parallelism_spin').set_value(self.parallelism)
+
+    def set_memory(self, spin_button):
+        self.memory = spin_button.get_value_as_int()
+
+    def set_parallelism(self, spin_button):
+        self.parallelism = spin_button.get_value_as_int()
+
+    def get_sort_command(self, options):
+        return ' '.join(['LC_ALL=C sort'] + options + [
+                '-S {}M'.format(self.memory),
+                '--parallel={}'.format(self.parallelism)])
+
+    def sort(self, lines, key, reverse=False):
+        sorter = extsort.ExternalSorter(key, reverse, self.memory << 20,
+                                        self.parallelism)
+        return sorter.sort(lines)
+
+class SortComponent(SortingComponent):
+    name = 'Sort'
+    category = 'Sorting'
+
+    properties = SortingComponent.properties + (
+            'key_field', 'delim', 'numeric', 'reverse')
+
+    properties_dialog = '''
+        <interface>''' + MEMORY_ADJUSTMENT + '''
+            <object class="GtkAdjustment" id="key_adjustment">
+                <property name="lower">0</property>
+                <property name="upper">1000</property>
+                <property name="step_increment">1</property>
+            </object>
+            <object class="GtkBox" id="properties_box">
+                <property name="orientation">vertical</property>
+                <child>
+                    <object class="GtkBox" id="key_box">
+                        <child><object class="GtkLabel" id="key_label">
+                            <property name="label">Key field (0 for the whole line)</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkSpinButton" id="key_spin">
+                                <property name="adjustment">key_adjustment</property>
+                                <signal name="value-changed" handler="set_key_field"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>
+                <child>
+                    <object class="GtkBox" id="delim_box">
+                        <child><object class="GtkLabel" id="delim_label">
+                            <property name="label">Delimiter</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkEntry" id="delim_entry">
+                                <property name="max_length">1</property>
+                                <signal name="changed" handler="set_delim"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>
+                <child>
+                    <object class="GtkCheckButton" id="numeric_check">
+                        <property name="label">Numeric</property>
+                        <signal name="toggled" handler="set_numeric"/>
+                    </object>
+                </child>
+                <child>
+                    <object class="GtkCheckButton" id="reverse_check">
+                        <property name="label">Reverse</property>
+                        <signal name="toggled" handler="set_reverse"/>
+                    </object>
+                </child>''' + MEMORY_PROPERTIES + '''
+            </object>
+        </interface>'''
+
+    def __init__(self):
+        super(SortComponent, self).__init__()
+        self.key_field = 0
+        self.delim = ''
+        self.numeric = False
+        self.reverse = False
+
+    def check_properties(self):
+        super(SortComponent, self).check_properties()
+        self.check_range('key_field', 0)
+        self.check_delim()
+
+    def init_properties(self, builder):
+        super(SortComponent, self).init_properties(builder)
+        builder.get_object('key_spin').set_value(self.key_field)
+        builder.get_object('delim_entry').set_text(self.delim or '')
+        builder.get_object('numeric_check').set_active(self.numeric)
+        builder.get_object('reverse_check').set_active(self.reverse)
+
+    def set_key_field(self, spin_button):
+        self.key_field = spin_button.get_value_as_int()
+
+    def set_delim(self, entry):
+        self.delim = entry.get_text()
+
+    def set_numeric(self, check_button):
+        self.numeric = check_button.get_active()
+
+    def set_reverse(self, check_button):
+        self.reverse = check_button.get_active()
+
+    def get_command(self):
+        # -s keeps lines with equal keys in input order, as sorted() does.
+        options = ['-s'] + _key_options(self.key_field, self.delim)
+        if self.numeric:
+            options.append('-g')
+        if self.reverse:
+            options.append('-r')
+        return self.get_sort_command(options)
+
+    def run(self, inputs, outputs):
+        key = extsort.SortKey(self.key_field, self.delim, self.numeric)
+        write = outputs[0].write
+        for line in self.sort(inputs[0], key, self.reverse):
+            write(line)
+
+class UniqComponent(SortingComponent):
+    name = 'Uniq'
+    category = 'Sorting'
+
+    properties = SortingComponent.properties + ('count',)
+
+    properties_dialog = '''
+        <interface>''' + MEMORY_ADJUSTMENT + '''
+            <object class="GtkBox" id="properties_box">
+                <property name="orientation">vertical</property>
+                <child>
+                    <object class="GtkCheckButton" id="count_check">
+                        <property name="label">Count lines</property>
+                        <signal name="toggled" handler="set_count"/>
+                    </object>
+                </child>''' + MEMORY_PROPERTIES + '''
+            </object>
+        </interface>'''
+
+    def __init__(self):
+        super(UniqComponent, self).__init__()
+        self.count = False
+
+    def init_properties(self, builder):
+        super(UniqComponent, self).init_properties(builder)
+        builder.get_object('count_check').set_active(self.count)
+
+    def set_count(self, check_button):
+        self.count = check_button.get_active()
+
+    def get_command(self):
+        if not self.count:
+            return self.get_sort_command(['-u'])
+        # Counted lines are written as "count,line".
+        return ('{ ' + self.get_sort_command([]) +
+                ' | uniq -c | sed -E \'s/^ *([0-9]+) /\\1,/\'; }')
+
+    def run(self, inputs, outputs):
+        write = outputs[0].write
+        for line, group in itertools.groupby(
+                self.sort(inputs[0], extsort.SortKey())):
+            if self.count:
+                write('{},{}'.format(sum(1 for l in group), line))
+            else:
+                write(line)
+
+def _mean(values):
+    total = 0
+    count = 0
+    for value in values:
+        total += value
+        count += 1
+    return total / count
+
+class GroupByComponent(SortingComponent):
+    name = 'Group By'
+    category = 'Calculations'
+
+    # Each aggregate's awk expression, given the sum s, count n, minimum lo
+    # and maximum hi, and the Python function of a group's values.
+    AGGREGATES = {
+        'count': ('n', None),
+        'sum': ('s + 0', sum),
+        'mean': ('s / n', _mean),
+        'min': ('lo', min),
+        'max': ('hi', max),
+    }
+
+    properties = SortingComponent.properties + (
+            'key_field', 'value_field', 'delim', 'aggregate')
+
+    properties_dialog = '''
+        <interface>''' + MEMORY_ADJUSTMENT + '''
+            <object class="GtkAdjustment" id="key_adjustment">
+                <property name="lower">1</property>
+                <property name="upper">1000</property>
+                <property name="step_increment">1</property>
+            </object>
+            <object class="GtkAdjustment" id="value_adjustment">
+                <property name="lower">1</property>
+                <property name="upper">1000</property>
+                <property name="step_increment">1</property>
+            </object>
+            <object class="GtkBox" id="properties_box">
+                <property name="orientation">vertical</property>
+                <child>
+                    <object class="GtkBox" id="key_box">
+                        <child><object class="GtkLabel" id="key_label">
+                            <property name="label">Key field</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkSpinButton" id="key_spin">
+                                <property name="adjustment">key_adjustment</property>
+                                <signal name="value-changed" handler="set_key_field"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>
+                <child>
+                    <object class="GtkBox" id="value_box">
+                        <child><object class="GtkLabel" id="value_label">
+                            <property name="label">Value field</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkSpinButton" id="value_spin">
+                                <property name="adjustment">value_adjustment</property>
+                                <signal name="value-changed" handler="set_value_field"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>
+                <child>
+                    <object class="GtkBox" id="delim_box">
+                        <child><object class="GtkLabel" id="delim_label">
+                            <property name="label">Delimiter</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkEntry" id="delim_entry">
+                                <property name="max_length">1</property>
+                                <signal name="changed" handler="set_delim"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>
+                <child>
+                    <object class="GtkBox" id="aggregate_box">
+                        <child><object class="GtkLabel" id="aggregate_label">
+                            <property name="label">Aggregate</property>
+                        </object></child>
+                        <child>
+                            <object class="GtkComboBoxText" id="aggregate_combo">
+                                <items>
+                                    <item id="count">Count</item>
+                                    <item id="sum">Sum</item>
+                                    <item id="mean">Mean</item>
+                                    <item id="min">Minimum</item>
+                                    <item id="max">Maximum</item>
+                                </items>
+                                <signal name="changed" handler="set_aggregate"/>
+                            </object>
+                            <packing>
+                                <property name="expand">True</property>
+                            </packing>
+                        </child>
+                    </object>
+                </child>''' + MEMORY_PROPERTIES + '''
+            </object>
+        </interface>'''
+
+    def __init__(self):
+        super(GroupByComponent, self).__init__()
+        self.key_field = 1
+        self.value_field = 2
+        self.delim = ','
+        self.aggregate = 'sum'
+
+    def check_properties(self):
+        super(GroupByComponent, self).check_properties()
+        self.check_range('key_field', 1)
+        self.check_range('value_field', 1)
+        self.check_choice('aggregate', self.AGGREGATES)
+        self.check_delim()
+
+    def init_properties(self, builder):
+        super(GroupByComponent, self).init_properties(builder)
+        builder.get_object('key_spin').set_value(self.key_field)
+        builder.get_object('value_spin').set_value(self.value_field)
+        builder.get_object('delim_entry').set_text(self.delim or '')
+        builder.get_object('aggregate_combo').set_active_id(self.aggregate)
+
+    def set_key_field(self, spin_button):
+        self.key_field = spin_button.get_value_as_int()
+
+    def set_value_field(self, spin_button):
+        self.value_field = spin_button.get_value_as_int()
+
+    def set_delim(self, entry):
+        self.delim = entry.get_text()
+
+    def set_aggregate(self, combo_box):
+        self.aggregate = combo_box.get_active_id()
+
+    def get_command(self):
+        # Once sorted, each group is a run of lines that awk folds as they
+        # stream past.  Keys are compared as strings, as sort does.
+        expression = self.AGGREGATES[self.aggregate][0]
+        separator = ('-F {} -v OFS={} '.format(
+                             shell_quote(_awk_separator(self.delim)),
+                             shell_quote(self.delim.replace('\\', '\\\\')))
+                     if self.delim else '')
+        script = ('NR > 1 && $K "" != key {{ print key, {e}; n = s = 0 }} '
+                  '{{ key = $K ""; v = $V + 0; s += v; '
+                  'if (!n || v < lo) lo = v; if (!n || v > hi) hi = v; n++ }} '
+                  'END {{ if (NR) print key, {e} }}').format(e=expression)
+        script = script.replace('$K', '$' + str(self.key_field)).replace(
+                '$V', '$' + str(self.value_field))
+        return '{{ {} | awk {}-v OFMT=%.15g {}; }}'.format(
+                self.get_sort_command(
+                        ['-s'] + _key_options(self.key_field, self.delim)),
+                separator, shell_quote(script))
+
+    def run(self, inputs, outputs):
+        key = extsort.SortKey(self.key_field, self.delim)
+        value = extsort.SortKey(self.value_field, self.delim)
+        separator = self.delim or ' '
+        function = self.AGGREGATES[self.aggregate][1]
+        write = outputs[0].write
+
+        for group_key, group in itertools.groupby(
+                self.sort(inputs[0], key), key):
+            if function is None:
+                result = sum(1 for line in group)
+            else:
+                result = function(_parse_number(value(line))
+                                  for line in group)
+            write(group_key + separator + _format_number(result))
 
 ACTIVE_COMPONENTS = [
         FileInputComponent,
@@ -248,4 +1490,11 @@ ACTIVE_COMPONENTS = [
         FilterComponent,
         SplitComponent,
         AddComponent,
+        SubtractComponent,
+        MultiplyComponent,
+        SumComponent,
+        MeanComponent,
+        SortComponent,
+        UniqComponent,
+        GroupByComponent,
 ]
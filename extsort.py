@@ -0,0 +1,196 @@
+'''Sorts streams of lines that may not fit in memory.
+
+Lines are gathered into runs of a bounded size, each run is sorted and, if
+the input turns out larger than one run, written to a temporary file.  The
+runs are then merged, a few at a time if there are very many of them.
+Sorting is stable, as with sorted().'''
+
+import os
+import re
+import heapq
+import shutil
+import tempfile
+import multiprocessing
+
+# A rough count of the memory a line takes beyond its characters: the
+# string object, its list slot, and its sort key.
+LINE_OVERHEAD = 100
+
+# At most this many runs are merged at once, so that sorting very large
+# inputs does not run out of file descriptors.
+MERGE_WIDTH = 64
+
+# The leading number strtod reads, as sort -g does: a decimal or hex
+# number, an infinity or a NaN.
+_NUMBER = re.compile(r'''\s*([-+]?)(?:
+        (0x(?:[0-9a-f]+\.?[0-9a-f]*|\.[0-9a-f]+)(?:p[-+]?\d+)?)
+      | ((?:\d+\.?\d*|\.\d+)(?:e[-+]?\d+)?)
+      | (inf(?:inity)?|nan)(?:\([0-9a-z_]*\))?
+    )''', re.IGNORECASE | re.VERBOSE)
+
+def parse_number(text):
+    'Returns the number text starts with, or None if it has none.'
+    match = _NUMBER.match(text)
+    if match is None:
+        return None
+    sign, hexadecimal, decimal, special = match.groups()
+    if hexadecimal is not None:
+        return float.fromhex(sign + hexadecimal)
+    return float(sign + (decimal or special))
+
+class SortKey(object):
+    '''The sort key of a line: a field of it, or all of it.
+
+    Fields are counted from 1 and split on delim, or on whitespace if delim
+    is empty.  Numeric keys are the number a field starts with, as for
+    sort -g, and put fields that do not start with one first, then NaN.  This is a class rather than a function so that it can be
+    sent to worker processes.'''
+
+    def __init__(self, field=0, delim='', numeric=False):
+        self.field = field
+        self.delim = delim
+        self.numeric = numeric
+
+    def __call__(self, line):
+        text = line.rstrip('\n')
+        if self.field:
+            fields = text.split(self.delim) if self.delim else text.split()
+            text = (fields[self.field - 1] if self.field <= len(fields)
+                    else '')
+        if not self.numeric:
+            return text
+        value = parse_number(text)
+        if value is None:
+            return (0, 0.0)
+        # NaN is unordered, so like sort -g it goes between the lines that
+        # are not numbers and those that are.
+        if value != value:
+            return (1, 0.0)
+        return (2, value)
+
+class _Reversed(object):
+    'Orders keys backwards, so runs merge in reverse keeping stability.'
+    __slots__ = ('key',)
+
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
+
+    def __eq__(self, other):
+        return self.key == other.key
+
+def _sort_run(lines, key, reverse, path):
+    lines.sort(key=key, reverse=reverse)
+    with open(path, 'w') as f:
+        f.writelines(lines)
+    return path
+
+def _read_run(path):
+    with open(path) as f:
+        for line in f:
+            yield line
+
+def _decorate(run, n, key, reverse):
+    for line in run:
+        k = key(line)
+        yield (_Reversed(k) if reverse else k), n, line
+
+def _merge(runs, key, reverse):
+    # Each line is decorated with its run's number, which breaks ties in
+    # favour of the earlier run and keeps the merge stable.
+    decorated = [_decorate(run, n, key, reverse)
+                 for n, run in enumerate(runs)]
+    for k, n, line in heapq.merge(*decorated):
+        yield line
+
+class ExternalSorter(object):
+    '''Sorts lines in at most about memory bytes, spilling runs to tmpdir.
+
+    With parallelism above 1, that many worker processes sort and write
+    runs while the next ones are read, each run then holding a share of
+    the memory.'''
+
+    def __init__(self, key=None, reverse=False, memory=256 << 20,
+                 parallelism=1, tmpdir=None):
+        self.key = key if key is not None else SortKey()
+        self.reverse = reverse
+        self.memory = memory
+        self.parallelism = parallelism
+        self.tmpdir = tmpdir
+
+    def sort(self, lines):
+        'Returns an iterator over the sorted lines, each ending in a newline.'
+        run_size = self.memory // (self.parallelism + 1)
+        workdir = None
+        pool = None
+        pending = []
+        paths = []
+        try:
+            run = []
+            size = 0
+            for line in lines:
+                if not line.endswith('\n'):
+                    line += '\n'
+                run.append(line)
+                size += len(line) + LINE_OVERHEAD
+                if size < run_size:
+                    continue
+
+                if workdir is None:
+                    workdir = tempfile.mkdtemp(prefix='plumber-sort.',
+                                               dir=self.tmpdir)
+                    if self.parallelism > 1:
+                        pool = multiprocessing.Pool(self.parallelism)
+                path = os.path.join(workdir, 'run{}'.format(len(paths)))
+                paths.append(path)
+                if pool is None:
+                    _sort_run(run, self.key, self.reverse, path)
+                else:
+                    # Waiting on the oldest run bounds the memory held by
+                    # runs still in flight.
+                    if len(pending) >= self.parallelism:
+                        pending.pop(0).get()
+                    pending.append(pool.apply_async(
+                            _sort_run, (run, self.key, self.reverse, path)))
+                run = []
+                size = 0
+
+            for result in pending:
+                result.get()
+
+            # Inputs that fit in one run never touch the disk.
+            run.sort(key=self.key, reverse=self.reverse)
+            if not paths:
+                for line in run:
+                    yield line
+                return
+
+            # Each pass merges neighbouring runs, which keeps them in input
+            # order.
+            merges = 0
+            while len(paths) > MERGE_WIDTH:
+                merged = []
+                for i in range(0, len(paths), MERGE_WIDTH):
+                    group = paths[i:i + MERGE_WIDTH]
+                    path = os.path.join(workdir, 'merge{}'.format(merges))
+                    merges += 1
+                    with open(path, 'w') as f:
+                        f.writelines(_merge([_read_run(p) for p in group],
+                                            self.key, self.reverse))
+                    for p in group:
+                        os.remove(p)
+                    merged.append(path)
+                paths = merged
+
+            # The last run stays in memory, and merges last so that ties
+            # still favour earlier input.
+            for line in _merge([_read_run(p) for p in paths] + [iter(run)],
+                               self.key, self.reverse):
+                yield line
+        finally:
+            if pool is not None:
+                pool.terminate()
+            if workdir is not None:
+                shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,230 @@
+'''Reads and writes the files at either end of a graph.
+
+Plain files are read through a memory map, asking the kernel to read each
+block ahead of the one being split into lines, and a file that is copied
+unchanged to another never passes through Python at all.  Compressed files
+go through the same gzip, pigz or zstd commands that compiled scripts use,
+which run alongside the graph in their own processes.'''
+
+import os
+import re
+import io
+import glob
+import itertools
+import mmap
+import codecs
+import locale
+import shutil
+import subprocess
+
+try:
+    from shlex import quote as shell_quote
+except ImportError:
+    from pipes import quote as shell_quote
+
+# Files are decoded as open() decodes them by default.
+ENCODING = locale.getpreferredencoding(False)
+
+COMPRESSIONS = ('auto', 'none', 'gzip', 'zstd')
+
+# The codec that 'auto' picks for each file name suffix.
+SUFFIXES = {
+    '.gz': 'gzip',
+    '.zst': 'zstd',
+}
+
+# Lines are split from blocks of this many bytes, which stay in the CPU
+# cache, while the kernel reads ahead this much of a file by default.
+BLOCK_SIZE = 64 << 10
+READ_AHEAD = 1 << 20
+
+# Files copied unchanged go this many bytes per system call, so a copy can
+# stop soon after being cancelled.
+COPY_BLOCK = 64 << 20
+
+_GLOB = re.compile(r'(\*|\?|\[[^]]*\])')
+
+def get_codec(compression, path):
+    'Returns the codec to read or write path with, or None for plain text.'
+    if compression == 'auto':
+        return SUFFIXES.get(os.path.splitext(path or '')[1])
+    if compression == 'none':
+        return None
+    return compression
+
+def decompress_command(codec, threads=1):
+    'Returns a command that decompresses the files named after it to stdout.'
+    if codec == 'gzip':
+        # pigz decompresses in one thread, but reads, writes and checks the
+        # data in others.
+        if threads > 1:
+            return ['pigz', '-dc', '-p', str(threads)]
+        return ['gzip', '-dc']
+    return ['zstd', '-dcq']
+
+def compress_command(codec, threads=1):
+    'Returns a command that compresses stdin to stdout.'
+    if codec == 'gzip':
+        if threads > 1:
+            return ['pigz', '-c', '-p', str(threads)]
+        return ['gzip', '-c']
+    return ['zstd', '-cq', '-T{}'.format(threads)]
+
+def has_pattern(path):
+    return _GLOB.search(path) is not None
+
+def expand(pattern):
+    '''Returns the files a glob pattern matches, in name order, as bash
+    lists them.
+
+    Raises IOError if it matches nothing.'''
+    if not has_pattern(pattern):
+        return [pattern]
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise IOError('No files match {}'.format(pattern))
+    return paths
+
+def quote_pattern(pattern):
+    'Quotes a glob pattern for the shell, leaving its wildcards to expand.'
+    parts = _GLOB.split(pattern)
+    return ''.join(part if i % 2 else shell_quote(part)
+                   for i, part in enumerate(parts) if part)
+
+def map_blocks(path, read_ahead=READ_AHEAD, size=BLOCK_SIZE):
+    '''Yields the bytes of a file in blocks of size bytes.
+
+    The file is memory mapped, and the kernel is asked to read it
+    read_ahead bytes at a time, a window ahead of the blocks handed out.'''
+    granularity = mmap.ALLOCATIONGRANULARITY
+    read_ahead = max(granularity, read_ahead // granularity * granularity)
+
+    with open(path, 'rb') as f:
+        length = os.fstat(f.fileno()).st_size
+        if not length:
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # madvise needs Python 3.8.
+            advise = getattr(mapped, 'madvise', None)
+            if advise is not None:
+                advise(mmap.MADV_SEQUENTIAL)
+            advised = 0
+            for start in range(0, length, size):
+                if (advise is not None and advised < length
+                        and advised <= start + read_ahead):
+                    advise(mmap.MADV_WILLNEED, advised,
+                           min(read_ahead, length - advised))
+                    advised += read_ahead
+                yield mapped[start:start + size]
+        finally:
+            mapped.close()
+
+def read_blocks(f, size=BLOCK_SIZE):
+    while True:
+        block = f.read(size)
+        if not block:
+            return
+        yield block
+
+def split_lines(blocks, encoding=ENCODING):
+    '''Turns blocks of bytes into lists of lines.
+
+    Lines end at newlines only, as they do for grep and awk, and may span
+    blocks.  The last line has no newline if the input did not end with
+    one.'''
+    decoder = codecs.getincrementaldecoder(encoding)()
+    rest = ''
+    for block in blocks:
+        lines = io.StringIO(rest + decoder.decode(block),
+                            newline='\n').readlines()
+        rest = ''
+        if lines and not lines[-1].endswith('\n'):
+            rest = lines.pop()
+        if lines:
+            yield lines
+
+    rest += decoder.decode(b'', True)
+    if rest:
+        yield [rest]
+
+def read_files(paths, codec=None, threads=1, read_ahead=READ_AHEAD):
+    '''Yields lists of the lines of files, read one after another as cat
+    joins them.
+
+    A codec's output is buffered read_ahead bytes at a time.'''
+    if codec is None:
+        blocks = itertools.chain.from_iterable(map_blocks(path, read_ahead)
+                                               for path in paths)
+        for lines in split_lines(blocks):
+            yield lines
+        return
+
+    with Process(decompress_command(codec, threads) + paths,
+                 stdout=subprocess.PIPE, bufsize=read_ahead) as process:
+        for lines in split_lines(read_blocks(process.stdout, BLOCK_SIZE)):
+            yield lines
+
+def write_file(path, chunks, codec=None, threads=1):
+    'Writes lists of lines to a file.'
+    if codec is None:
+        with open(path, 'w') as f:
+            for chunk in chunks:
+                f.writelines(chunk)
+        return
+
+    with open(path, 'wb') as f:
+        with Process(compress_command(codec, threads), stdin=subprocess.PIPE,
+                     stdout=f) as process:
+            for chunk in chunks:
+                process.stdin.write(''.join(chunk).encode(ENCODING))
+
+class Process(object):
+    '''Runs a codec command, and checks that it succeeded once done with.
+
+    A command that is still running when the block exits early, because of
+    an error or a cancelled run, is killed.'''
+
+    def __init__(self, args, **kwargs):
+        self.args = args
+        self.process = subprocess.Popen(args, **kwargs)
+
+    def __enter__(self):
+        return self.process
+
+    def __exit__(self, type, value, traceback):
+        process = self.process
+        if type is not None and process.poll() is None:
+            process.kill()
+        for f in (process.stdin, process.stdout):
+            if f is not None:
+                f.close()
+        process.wait()
+        if type is None and process.returncode != 0:
+            raise IOError('{} exited with status {}'.format(
+                    self.args[0], process.returncode))
+
+def copy_file(source, sink, cancelled=None):
+    '''Copies source to sink inside the kernel where the system can.
+
+    cancelled, if given, is called between blocks, and stops the copy by
+    returning True.'''
+    with open(source, 'rb') as src:
+        with open(sink, 'wb') as dst:
+            sendfile = getattr(os, 'sendfile', None)
+            offset = 0
+            while sendfile is not None:
+                if cancelled is not None and cancelled():
+                    return
+                try:
+                    sent = sendfile(dst.fileno(), src.fileno(), offset,
+                                    COPY_BLOCK)
+                except OSError:
+                    # Some systems only send to sockets.
+                    if offset:
+                        raise
+                    break
+                if not sent:
+                    return
+                offset += sent
+            shutil.copyfileobj(src, dst, COPY_BLOCK)
@@ -0,0 +1,138 @@
+import re
+import json
+from collections import deque
+
+import components
+import registry
+
+# Version 1 stored components as objects and pipes as [start, end] pairs.
+# Version 2 stores each component as [type, properties, x, y] and each pipe
+# as [start, start port, end, end port], so ports survive a reload.
+FORMAT_VERSION = 2
+
+class GraphFormatError(Exception): pass
+
+def dump(component_list, f, positions=None):
+    '''Writes a graph of components to the file f.
+
+    positions is an optional list of canvas (x, y) pairs, one per component.'''
+    f.write(dumps(component_list, positions))
+
+def dumps(component_list, positions=None):
+    'Returns a graph of components as the text dump would write.'
+    if positions is None:
+        positions = [(0, 0)] * len(component_list)
+    index = dict((component, i) for i, component in enumerate(component_list))
+    end_ports = dict((pipe, port) for component in component_list
+                     for port, pipe in enumerate(component.input_pipes))
+
+    pipes = []
+    for component in component_list:
+        for start_port, pipe in enumerate(component.output_pipes):
+            pipes.append([index[pipe.start], start_port, index[pipe.end],
+                          end_ports[pipe]])
+
+    return json.dumps({
+        'version': FORMAT_VERSION,
+        'components': [[component.name, component.get_properties(), x, y]
+                       for component, (x, y) in zip(component_list,
+                                                    positions)],
+        'pipes': pipes,
+    }, separators=(',', ':'))
+
+def load(f):
+    '''Reads a graph written by dump.
+
+    Returns the list of components and the list of their canvas positions.
+    Graphs from version 1 files have no positions, so those are None.'''
+    return loads(f.read())
+
+def loads(text):
+    'Reads a graph from the text dumps returns.'
+    try:
+        data = json.loads(text)
+    except ValueError as e:
+        raise GraphFormatError('Not a graph file: {}'.format(e))
+    if not isinstance(data, dict):
+        raise GraphFormatError('Not a graph file')
+
+    version = data.get('version')
+    try:
+        if version == 1:
+            entries = [(c['type'], c.get('properties', {}), None)
+                       for c in data['components']]
+            pipes = [(start, None, end, None) for start, end in data['pipes']]
+        elif version == FORMAT_VERSION:
+            entries = [(name, properties, (x, y))
+                       for name, properties, x, y in data['components']]
+            pipes = [tuple(pipe) for pipe in data['pipes']]
+        else:
+            raise GraphFormatError(
+                    'Unsupported graph version: {}'.format(version))
+    except (KeyError, TypeError, ValueError, AttributeError) as e:
+        raise GraphFormatError('Invalid graph file: {!r}'.format(e))
+
+    component_list = []
+    positions = []
+    for name, properties, position in entries:
+        try:
+            component = registry.get_components()[name]()
+        except (KeyError, TypeError):
+            raise GraphFormatError('Unknown component type: {}'.format(name))
+        try:
+            if not isinstance(properties, dict):
+                raise TypeError('properties must be an object')
+            component.set_properties(properties)
+        except (re.error, IOError, KeyError, TypeError, ValueError,
+                AttributeError) as e:
+            raise GraphFormatError('Invalid {} properties: {}'.format(name, e))
+        component_list.append(component)
+        positions.append(position)
+
+    ports = {}
+    for entry in pipes:
+        try:
+            start, start_port, end, end_port = entry
+            if not (_is_index(start, len(component_list))
+                    and _is_index(end, len(component_list))):
+                raise ValueError()
+            if version != 1 and not (
+                    _is_index(start_port, component_list[start].outputs)
+                    and _is_index(end_port, component_list[end].inputs)):
+                raise ValueError()
+            pipe = components.Pipe(component_list[start], component_list[end])
+        except (TypeError, ValueError, components.FullPipeError):
+            raise GraphFormatError('Invalid pipe: {}'.format(list(entry)))
+        ports[pipe] = (start_port, end_port)
+
+    # Pipes attach in file order, so put them back on the ports they came from.
+    if version != 1:
+        for component in component_list:
+            component.output_pipes.sort(key=lambda pipe: ports[pipe][0])
+            component.input_pipes.sort(key=lambda pipe: ports[pipe][1])
+
+    return component_list, positions
+
+def _is_index(value, count):
+    return (isinstance(value, int) and not isinstance(value, bool)
+            and 0 <= value < count)
+
+def sort_components(components):
+    '''Orders components so that every producer comes before its consumers.
+
+    Components on a cycle, or downstream of one, are never ready, and are
+    left out of the order.'''
+    in_degree = dict((component, len(component.input_pipes))
+                     for component in components)
+    ready = deque(component for component in components
+                  if in_degree[component] == 0)
+
+    order = []
+    while ready:
+        component = ready.popleft()
+        order.append(component)
+        for pipe in component.output_pipes:
+            in_degree[pipe.end] -= 1
+            if in_degree[pipe.end] == 0:
+                ready.append(pipe.end)
+    return order
@@ -0,0 +1,1266 @@
+from __future__ import division
+
+import os
+import sys
+import math
+import time
+import shutil
+import threading
+
+# Taken before GTK is imported, so the startup report covers importing it.
+START_TIME = time.time()
+
+import cairo
+from gi.repository import Gtk, Gdk, GObject
+
+import cache
+import codegen
+import components
+import graph
+import metrics
+import registry
+import runtime
+import spatial
+
+UI_FILE = 'gui.xml'
+ID_MAIN_WINDOW = 'main_window'
+ID_TOOLBAR_BUTTON = 'toolbar_'
+ID_COMPONENT_PALETTE = 'component_palette'
+ID_CANVAS = 'canvas'
+ID_SAVE_PROGRESS = 'save_progress'
+
+GRAPH_EXTENSION = '.json'
+SCRIPT_EXTENSION = '.sh'
+
+class PlumberPart(object):
+    def __init__(self, app):
+        self.app = app
+
+    # This class needs to be subclassed
+    def init_ui(self):
+        raise NotImplementedError('Implement this!')
+
+class Toolbar(PlumberPart):
+    BUTTONS = ('save', 'open', 'edit', 'delete', 'undo', 'redo', 'play',
+               'stop', 'help',)
+
+    # Milliseconds between updates of the runtime metrics on the canvas.
+    METRICS_INTERVAL = 1000
+
+    def init_ui(self):
+        self.pipeline = None
+        self.code_cache = codegen.CodeCache()
+        self.save_thread = None
+
+        for name in Toolbar.BUTTONS:
+            button = self.app.builder.get_object(ID_TOOLBAR_BUTTON + name)
+            button.connect('clicked', getattr(self, 'do_' + name))
+
+    def do_save(self, button):
+        dialog = Gtk.FileChooserDialog(
+                'Save...',
+                self.app.builder.get_object(ID_MAIN_WINDOW),
+                Gtk.FileChooserAction.SAVE,
+                (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                    Gtk.STOCK_OK, Gtk.ResponseType.OK))
+        self.add_filters(dialog)
+
+        response = dialog.run()
+        filename = dialog.get_filename()
+        dialog.destroy()
+        if response != Gtk.ResponseType.OK:
+            return
+        if self.save_thread is not None:
+            print('Still saving, try again when it is done')
+            return
+
+        # The file is written from a copy of the graph, on another thread,
+        # so the canvas stays usable while a large graph is saved.
+        canvas = self.app.canvas
+        data = graph.dumps(canvas.get_components(), canvas.get_positions())
+
+        progress = self.app.builder.get_object(ID_SAVE_PROGRESS)
+        progress.set_text('Saving {}'.format(filename))
+        progress.set_fraction(0)
+        progress.show()
+
+        self.save_thread = threading.Thread(target=self.save,
+                                            args=(filename, data))
+        self.save_thread.daemon = True
+        self.save_thread.start()
+
+    def save(self, filename, data):
+        # The file is written beside its target and renamed over it once
+        # complete, so a failed save leaves the previous one in place.
+        temp = os.path.join(os.path.dirname(filename),
+                            '.{}.saving'.format(os.path.basename(filename)))
+        error = None
+        try:
+            with open(temp, 'w') as f:
+                if filename.endswith(SCRIPT_EXTENSION):
+                    component_list, positions = graph.loads(data)
+                    codegen.write_script(f, component_list, self.code_cache,
+                                         self.on_save_progress)
+                else:
+                    f.write(data)
+            if os.path.exists(filename):
+                shutil.copymode(filename, temp)
+            os.rename(temp, filename)
+        except Exception as e:
+            # Anything, including errors in plugin components, must reach
+            # on_saved, or no later save could start.
+            error = e
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+        GObject.idle_add(self.on_saved, filename, error)
+
+    def on_save_progress(self, done, total):
+        GObject.idle_add(self.show_save_progress,
+                         done / total if total else 1)
+
+    def show_save_progress(self, fraction):
+        self.app.builder.get_object(ID_SAVE_PROGRESS).set_fraction(fraction)
+        return False
+
+    def on_saved(self, filename, error):
+        self.save_thread = None
+        self.app.builder.get_object(ID_SAVE_PROGRESS).hide()
+        if error is not None:
+            print('Could not save {}: {}'.format(filename, error))
+        return False
+
+    def do_open(self, button):
+        dialog = Gtk.FileChooserDialog(
+                'Open...',
+                self.app.builder.get_object(ID_MAIN_WINDOW),
+                Gtk.FileChooserAction.OPEN,
+                (Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL,
+                    Gtk.STOCK_OK, Gtk.ResponseType.OK))
+        self.add_filters(dialog)
+
+        if dialog.run() == Gtk.ResponseType.OK:
+            try:
+                with open(dialog.get_filename()) as f:
+                    component_list, positions = graph.load(f)
+            except (IOError, graph.GraphFormatError) as e:
+                print('Could not open {}: {}'.format(dialog.get_filename(), e))
+            else:
+                self.app.canvas.load(component_list, positions)
+
+        dialog.destroy()
+
+    @staticmethod
+    def add_filters(dialog):
+        for name, extension in (('Plumber graphs', GRAPH_EXTENSION),
+                                ('Bash scripts', SCRIPT_EXTENSION)):
+            file_filter = Gtk.FileFilter()
+            file_filter.set_name(name)
+            file_filter.add_pattern('*' + extension)
+            dialog.add_filter(file_filter)
+
+    def do_edit(self, button):
+        print('EDIT')
+
+    def do_delete(self, button):
+        print('DELETE')
+
+    def do_undo(self, button):
+        print('UNDO')
+
+    def do_redo(self, button):
+        print('REDO')
+
+    def do_play(self, button):
+        if self.pipeline and self.pipeline.is_running():
+            return
+
+        self.pipeline = runtime.Pipeline(self.app.canvas.get_components(),
+                                         self.app.result_cache)
+        self.sampler = metrics.Sampler(self.pipeline)
+        self.app.canvas.clear_metrics()
+        self.pipeline.start(
+                lambda pipeline: GObject.idle_add(self.on_finished, pipeline))
+        GObject.timeout_add(self.METRICS_INTERVAL, self.on_metrics,
+                            self.pipeline)
+
+    def on_metrics(self, pipeline):
+        if pipeline is not self.pipeline or not pipeline.is_running():
+            return False
+        self.app.canvas.show_metrics(pipeline.components,
+                                     self.sampler.sample())
+        return True
+
+    def on_finished(self, pipeline):
+        # Short runs end before the first update, so show how they went.
+        if pipeline is self.pipeline:
+            self.app.canvas.show_metrics(pipeline.components,
+                                         self.sampler.sample())
+
+        for component, error in pipeline.errors:
+            print('{} failed: {}'.format(component.name, error))
+        if pipeline.cancelled and not pipeline.errors:
+            print('Stopped')
+        return False
+
+    def do_stop(self, button):
+        if self.pipeline:
+            self.pipeline.cancel()
+
+    def do_help(self, button):
+        print('HELP')
+
+class SpriteCache(object):
+    '''Pre-rendered component images.
+
+    A component's image depends only on what its key captures, so every
+    drawer with the same key blits the same surface.'''
+
+    def __init__(self):
+        self.sprites = {}
+
+    def get(self, key, target, width, height, zoom, render):
+        try:
+            return self.sprites[key]
+        except KeyError:
+            pass
+
+        # Similar surfaces inherit the target's device scale, so sprites
+        # stay sharp on high resolution screens.  Zoomed sprites are drawn
+        # at their zoomed size for the same reason.
+        sprite = target.create_similar(cairo.CONTENT_COLOR_ALPHA,
+                                       int(math.ceil(width * zoom)),
+                                       int(math.ceil(height * zoom)))
+        ctx = cairo.Context(sprite)
+        ctx.scale(zoom, zoom)
+        render(ctx, width, height)
+        self.sprites[key] = sprite
+        return sprite
+
+    def clear(self):
+        self.sprites = {}
+
+class ComponentPainter(object):
+    '''Draws a component, for both component widgets and canvas nodes.
+
+    Subclasses provide component, is_icon and is_selected.'''
+
+    ICON_WIDTH = 50
+    ICON_HEIGHT = 50
+
+    CANVAS_WIDTH = 125
+    CANVAS_HEIGHT = 55
+
+    FONT_FACE = 'Sans'
+    FONT_SIZE = 15
+
+    BASE_MARGIN = 10
+    BASE_CORNER_RADIUS = 6
+    BASE_LINE_WIDTH = 2
+    BASE_STROKE_COLOR = (0, 0, 0)
+    BASE_FILL_COLOR = (135 / 255, 206 / 255, 250 / 255)
+    BASE_FILL_COLOR_SELECTED = (255 / 255, 215 / 255, 0 / 255)
+
+    PORT_RADIUS = 4
+    PORT_LINE_WIDTH = 1
+    PORT_STROKE_COLOR = (0, 0, 0)
+    PORT_IN_COLOR = (34 / 255, 139 / 255, 34 / 255)
+    PORT_OUT_COLOR = (255 / 255, 140 / 255, 0 / 255)
+
+    BADGE_FONT_SIZE = 10
+    BADGE_COLOR = (139 / 255, 0 / 255, 0 / 255)
+
+    sprite_cache = SpriteCache()
+
+    # Runtime metrics shown over the component, which change too often to
+    # be part of the sprite.
+    badge = None
+
+    def paint(self, ctx, width, height, scale, zoom=1):
+        key = (self.component.name, self.component.inputs,
+               self.component.outputs, self.is_icon, self.is_selected, width,
+               height, scale, zoom)
+        sprite = self.sprite_cache.get(key, ctx.get_target(), width, height,
+                                       zoom, self.draw_component)
+
+        ctx.save()
+        if zoom != 1:
+            ctx.scale(1 / zoom, 1 / zoom)
+        ctx.set_source_surface(sprite, 0, 0)
+        ctx.paint()
+        ctx.restore()
+
+        if self.badge:
+            self.draw_badge(ctx, width, height)
+
+    def draw_component(self, ctx, width, height):
+        self.draw_base(ctx, width, height)
+        self.draw_inputs(ctx, width, height)
+        self.draw_outputs(ctx, width, height)
+        if not self.is_icon:
+            self.draw_name(ctx, width, height)
+
+    def draw_base(self, ctx, width, height):
+        x1 = y1 = self.BASE_MARGIN
+        x2 = width - self.BASE_MARGIN
+        y2 = height - self.BASE_MARGIN
+        r = self.BASE_CORNER_RADIUS
+
+        # From http://cairographics.org/cookbook/roundedrectangles Method D
+        ctx.arc(x1 + r, y1 + r, r, 2 * (math.pi / 2), 3 * (math.pi / 2))
+        ctx.arc(x2 - r, y1 + r, r, 3 * (math.pi / 2), 4 * (math.pi / 2))
+        ctx.arc(x2 - r, y2 - r, r, 0, math.pi / 2)
+        ctx.arc(x1 + r, y2 - r, r, math.pi / 2, 2 * (math.pi / 2))
+        ctx.close_path()
+
+        ctx.set_line_width(self.BASE_LINE_WIDTH)
+        ctx.set_source_rgb(*self.BASE_STROKE_COLOR)
+        ctx.stroke_preserve()
+        if self.is_selected:
+            ctx.set_source_rgb(*self.BASE_FILL_COLOR_SELECTED)
+        else:
+            ctx.set_source_rgb(*self.BASE_FILL_COLOR)
+        ctx.fill()
+
+    def draw_inputs(self, ctx, width, height):
+        if self.component.inputs == 0:
+            return
+
+        self.draw_ports(ctx, width, height, self.BASE_MARGIN,
+                        self.component.inputs, self.PORT_IN_COLOR)
+
+    def draw_outputs(self, ctx, width, height):
+        if self.component.outputs == 0:
+            return
+
+        self.draw_ports(ctx, width, height, width - self.BASE_MARGIN,
+                        self.component.outputs, self.PORT_OUT_COLOR)
+
+    @classmethod
+    def draw_ports(cls, ctx, width, height, x, count, color):
+        available_space = (height - cls.BASE_MARGIN * 2)
+        offset = available_space / (count + 1)
+
+        y = cls.BASE_MARGIN + offset
+
+        ctx.set_line_width(cls.PORT_LINE_WIDTH)
+        for c in range(count):
+            ctx.arc(x, y, cls.PORT_RADIUS, 0, 360)
+            ctx.set_source_rgb(0, 0, 0)
+            ctx.close_path()
+            ctx.stroke_preserve()
+            ctx.set_source_rgb(*color)
+            ctx.fill()
+            y += offset
+
+    def draw_name(self, ctx, width, height):
+        ctx.select_font_face(self.FONT_FACE)
+        ctx.set_font_size(self.FONT_SIZE)
+        ctx.move_to(self.BASE_MARGIN * 2, height - self.BASE_MARGIN * 2)
+        ctx.set_source_rgb(0, 0, 0)
+        ctx.show_text(self.component.name)
+        ctx.stroke()
+
+    def draw_badge(self, ctx, width, height):
+        ctx.select_font_face(self.FONT_FACE)
+        ctx.set_font_size(self.BADGE_FONT_SIZE)
+        ctx.move_to(self.BASE_MARGIN * 2,
+                    self.BASE_MARGIN + self.BADGE_FONT_SIZE + 2)
+        ctx.set_source_rgb(*self.BADGE_COLOR)
+        ctx.show_text(self.badge)
+
+class ComponentDrawer(Gtk.DrawingArea, ComponentPainter):
+    def __init__(self, builder, component, is_icon):
+        super(ComponentDrawer, self).__init__()
+        self.set_has_window(False)
+        self.builder = builder
+        self.component = component
+        self.is_icon = is_icon
+        self.is_drag = False
+        self.is_selected = False
+
+        self.connect('draw', self.do_draw)
+
+        if self.is_icon:
+            self.set_size_request(self.ICON_WIDTH, self.ICON_HEIGHT)
+        else:
+            self.set_size_request(self.CANVAS_WIDTH, self.CANVAS_HEIGHT)
+
+    def do_draw(self, *args):
+        if len(args) == 1:
+            ctx = args[0]
+        else:
+            ctx = args[1]
+
+        self.paint(ctx, self.get_allocated_width(),
+                   self.get_allocated_height(), self.get_scale_factor())
+
+class ComponentPalette(PlumberPart):
+    # Buttons are added this many at a time while idle, after the window
+    # first shows.
+    BUTTON_BATCH = 50
+
+    def init_ui(self):
+        self.categories = {}
+        self.pending = list(self.app.components.values())[::-1]
+        GObject.idle_add(self.add_pending_buttons)
+
+    def add_pending_buttons(self):
+        for i in range(min(self.BUTTON_BATCH, len(self.pending))):
+            self.add_button(self.pending.pop())
+        if self.pending:
+            return True
+        self.app.mark('palette filled')
+        return False
+
+    def add_button(self, component):
+        button = Gtk.ToolButton.new(None, component.name)
+        button.set_icon_widget(ComponentDrawer(self.app.builder, component,
+                                               True))
+        button.set_use_drag_window(True)
+        button.drag_source_set(Gdk.ModifierType.BUTTON1_MASK, None, Gdk.DragAction.COPY)
+        button.drag_source_add_text_targets()
+
+        button.connect('drag-data-get', self.do_data_get, component.name)
+
+        try:
+            group = self.categories[component.category]
+        except KeyError:
+            group = Gtk.ToolItemGroup(label=component.category)
+            # Plugin icons import their module to draw their ports, so
+            # their groups wait until they are opened.
+            group.set_collapsed(
+                    isinstance(component, registry.ComponentEntry))
+            self.categories[component.category] = group
+            pane = self.app.builder.get_object(ID_COMPONENT_PALETTE)
+            pane.add(group)
+            group.show()
+
+        group.add(button)
+        button.show_all()
+
+    def do_data_get(self, button, context, data, info, time, name):
+        data.set_text(name, len(name))
+
+class Node(ComponentPainter):
+    '''A component placed on the canvas, with or without a widget yet.
+
+    In virtual mode nodes never get a widget; the canvas paints them.'''
+
+    is_icon = False
+
+    def __init__(self, component, x, y, depth):
+        self.component = component
+        self.x = x
+        self.y = y
+        self.depth = depth
+        self.box = None
+        self.is_selected = False
+
+    def get_box(self):
+        return (self.x, self.y, self.x + self.CANVAS_WIDTH,
+                self.y + self.CANVAS_HEIGHT)
+
+class PipeDrawer(object):
+    PIPE_WIDTH = 6
+    PIPE_COLOR = (0, 0, 0)
+
+    # While a graph runs, pipes narrow down to MIN_PIPE_WIDTH as their
+    # throughput drops below the busiest pipe's, and turn BACKLOG_COLOR as
+    # their queue fills up.
+    MIN_PIPE_WIDTH = 2
+    BACKLOG_COLOR = (220 / 255, 20 / 255, 60 / 255)
+
+    def __init__(self, pipe, start_node, end_node):
+        self.pipe = pipe
+        self.start_node = start_node
+        self.end_node = end_node
+        self.clear_metrics()
+
+    @property
+    def start(self):
+        return self.pipe.start
+
+    @property
+    def end(self):
+        return self.pipe.end
+
+    def update_geometry(self):
+        '''Recomputes the pipe's points, after either end moves or changes.
+
+        Drawing uses the cached points, so this is the only place that
+        needs the port index, which costs a list search.'''
+        available_space = (ComponentDrawer.CANVAS_HEIGHT
+                           - ComponentDrawer.BASE_MARGIN * 2)
+
+        start_n = self.start.output_pipes.index(self.pipe) + 1
+        end_n = self.end.input_pipes.index(self.pipe) + 1
+
+        start_offset = available_space / (self.start.outputs + 1) * start_n
+        end_offset = available_space / (self.end.inputs + 1) * end_n
+
+        start_x = self.start_node.x + ComponentDrawer.CANVAS_WIDTH - ComponentDrawer.BASE_MARGIN
+        start_y = self.start_node.y + start_offset + ComponentDrawer.BASE_MARGIN
+
+        end_x = self.end_node.x + ComponentDrawer.BASE_MARGIN
+        end_y = self.end_node.y + end_offset + ComponentDrawer.BASE_MARGIN
+
+        mid_x = start_x + ((end_x - start_x) / 2)
+        self.points = ((start_x, start_y), (mid_x, start_y), (mid_x, end_y),
+                       (end_x, end_y))
+
+    def get_segment_boxes(self):
+        margin = self.PIPE_WIDTH / 2
+        for (x1, y1), (x2, y2) in zip(self.points, self.points[1:]):
+            yield (min(x1, x2) - margin, min(y1, y2) - margin,
+                   max(x1, x2) + margin, max(y1, y2) + margin)
+
+    def set_metrics(self, throughput, fill):
+        '''Shows a pipe's share of the top throughput and its queue fill,
+        both from 0 to 1.'''
+        self.width = (self.MIN_PIPE_WIDTH
+                      + (self.PIPE_WIDTH - self.MIN_PIPE_WIDTH) * throughput)
+        self.color = tuple(a + (b - a) * fill for a, b in
+                           zip(self.PIPE_COLOR, self.BACKLOG_COLOR))
+
+    def clear_metrics(self):
+        self.width = self.PIPE_WIDTH
+        self.color = self.PIPE_COLOR
+
+    def do_draw(self, ctx):
+        ctx.set_line_width(self.width)
+        ctx.set_source_rgb(*self.color)
+        ctx.set_line_join(cairo.LINE_JOIN_ROUND)
+        ctx.set_line_cap(cairo.LINE_CAP_ROUND)
+
+        self.trace(ctx)
+        ctx.stroke()
+
+    @classmethod
+    def draw_outlines(cls, ctx, pipes):
+        'Draws many pipes as plain lines, with a single stroke.'
+        ctx.set_line_width(cls.PIPE_WIDTH)
+        ctx.set_source_rgb(*cls.PIPE_COLOR)
+        for pipe in pipes:
+            pipe.trace(ctx)
+        ctx.stroke()
+
+    def trace(self, ctx):
+        ctx.move_to(*self.points[0])
+        for point in self.points[1:]:
+            ctx.line_to(*point)
+
+class DialogTemplate(object):
+    '''A component type's properties dialog, parsed once and reused.
+
+    Signal handlers are looked up on whichever component is attached when
+    the signal fires.'''
+
+    def __init__(self, xml):
+        self.component = None
+        self.builder = Gtk.Builder()
+        self.builder.add_from_string(xml)
+        self.builder.connect_signals(self)
+        self.box = self.builder.get_object('properties_box')
+
+    def attach(self, component):
+        # Filling in the widgets fires their signals, which must not reach
+        # the component as if the user had made changes.
+        self.component = None
+        if component is not None:
+            component.init_properties(self.builder)
+        self.component = component
+
+    def __getattr__(self, name):
+        # Called for handler names, which the template itself lacks.
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        def handler(*args):
+            if self.component is not None:
+                getattr(self.component, name)(*args)
+        return handler
+
+class Canvas(PlumberPart):
+    GRID_SPACING = 30
+    GRID_LENGTH = 3
+    GRID_WIDTH = 0.1
+
+    # Cell size of the spatial indexes of nodes and pipe segments.
+    NODE_INDEX_CELL = 256
+    PIPE_INDEX_CELL = 256
+
+    # Widgets for a loaded graph are created this many at a time while idle.
+    WIDGET_BATCH = 100
+
+    # Graphs with more nodes than this are loaded in virtual mode.
+    VIRTUAL_NODES = 1000
+
+    # Columns used to lay out graphs that were saved without positions.
+    LAYOUT_COLUMNS = 8
+
+    # Each zoom step scales the view by ZOOM_STEP, from MIN_ZOOM_LEVEL steps
+    # out to MAX_ZOOM_LEVEL steps in.  Below DETAIL_ZOOM, components are
+    # drawn as plain boxes and the grid is left out.
+    ZOOM_STEP = 1.25
+    MIN_ZOOM_LEVEL = -12
+    MAX_ZOOM_LEVEL = 4
+    DETAIL_ZOOM = 0.5
+
+    # How far one step of the scroll wheel pans the view, in pixels.
+    SCROLL_STEP = 50
+
+    def __init__(self, app, virtual=False):
+        super(Canvas, self).__init__(app)
+        self.force_virtual = virtual
+
+    def init_ui(self):
+        self.virtual = self.force_virtual
+        self.nodes = {}
+        self.node_index = spatial.GridIndex(self.NODE_INDEX_CELL)
+        self.pending_nodes = []
+        self.pipes = {}
+        self.pipe_index = spatial.GridIndex(self.PIPE_INDEX_CELL)
+        self.background = None
+        self.background_scale = None
+        self.view_x = 0
+        self.view_y = 0
+        self.zoom_level = 0
+        self.zoom = 1
+        self.pan_origin = None
+        self.selection = set()
+        self.drag_nodes = []
+        self.drag_tick = None
+        self.add_pipe_node = None
+        self.remove_pipe_node = None
+        self.dialog_templates = {}
+
+        canvas = self.app.builder.get_object(ID_CANVAS)
+        canvas.add_events(Gdk.EventMask.POINTER_MOTION_HINT_MASK
+                          | Gdk.EventMask.BUTTON_MOTION_MASK
+                          | Gdk.EventMask.BUTTON_PRESS_MASK
+                          | Gdk.EventMask.BUTTON_RELEASE_MASK
+                          | Gdk.EventMask.SCROLL_MASK)
+
+        canvas.drag_dest_set(Gtk.DestDefaults.MOTION | Gtk.DestDefaults.DROP,
+                             None, Gdk.DragAction.COPY)
+        canvas.drag_dest_add_text_targets()
+
+        canvas.connect('draw', self.do_draw)
+        canvas.connect('button-press-event', self.do_press)
+        canvas.connect('button-release-event', self.do_release)
+        canvas.connect('motion-notify-event', self.do_motion)
+        canvas.connect('scroll-event', self.do_scroll)
+        canvas.connect('drag-data-received', self.do_drag_received)
+
+    def do_child_press(self, component_box, event):
+        self.press_node(component_box.node, event)
+
+    def do_child_release(self, component_box, event):
+        self.end_drag()
+
+    def do_press(self, canvas, event):
+        # Component widgets handle their own presses, which then bubble up
+        # here, so the canvas only hit-tests nodes in virtual mode.
+        if not self.virtual:
+            return False
+
+        node = self.find_node(*self.to_canvas(event.x, event.y))
+        if node is not None:
+            self.press_node(node, event)
+        elif event.button == 1 and event.type == Gdk.EventType.BUTTON_PRESS:
+            self.pan_origin = (event.x_root, event.y_root, self.view_x,
+                               self.view_y)
+        return True
+
+    def do_release(self, canvas, event):
+        if not self.virtual:
+            return False
+
+        self.end_drag()
+        self.pan_origin = None
+        return True
+
+    def find_node(self, x, y):
+        'Returns the topmost node at a canvas position, or None.'
+        nodes = self.node_index.query_point(x, y)
+        if not nodes:
+            return None
+        return max(nodes, key=lambda node: node.depth)
+
+    def press_node(self, node, event):
+        component = node.component
+
+        if event.button == 1 and event.type == Gdk.EventType.BUTTON_PRESS:
+            if event.state & Gdk.ModifierType.CONTROL_MASK:
+                self.toggle_selected(node)
+            elif node not in self.selection:
+                self.clear_selection()
+            self.start_drag(node, event)
+        else:
+            self.drag_nodes = []
+
+        # Connecting pipes uses the same highlight as the selection.
+        if event.button in (2, 3):
+            self.clear_selection()
+
+        if event.button == 1 and event.type == Gdk.EventType._2BUTTON_PRESS:
+            self.show_properties(component)
+
+        if event.button == 3 and event.type == Gdk.EventType.BUTTON_PRESS:
+            if self.add_pipe_node is node:
+                self.add_pipe_node = None
+                self.set_highlight(node, False)
+
+            elif self.add_pipe_node:
+                self.add_pipe(self.add_pipe_node, node)
+                self.set_highlight(self.add_pipe_node, False)
+                self.add_pipe_node = None
+                self.set_highlight(node, False)
+
+            else:
+                self.add_pipe_node = node
+                self.set_highlight(node, True)
+        elif self.add_pipe_node:
+            self.set_highlight(self.add_pipe_node, False)
+            self.add_pipe_node = None
+
+        if event.button == 2 and event.type == Gdk.EventType.BUTTON_PRESS:
+            if self.remove_pipe_node is node:
+                self.remove_pipe_node = None
+                self.set_highlight(node, False)
+
+            elif self.remove_pipe_node:
+                self.remove_pipe(self.remove_pipe_node, node)
+                self.set_highlight(self.remove_pipe_node, False)
+                self.remove_pipe_node = None
+                self.set_highlight(node, False)
+
+            else:
+                self.remove_pipe_node = node
+                self.set_highlight(node, True)
+        elif self.remove_pipe_node:
+            self.set_highlight(self.remove_pipe_node, False)
+            self.remove_pipe_node = None
+
+        self.app.builder.get_object(ID_CANVAS).queue_draw()
+
+    def show_metrics(self, component_list, snapshot):
+        '''Shows a metrics.Sampler snapshot of a pipeline that runs
+        component_list.'''
+        top_rate = max([stats['lines_per_sec'] for stats in snapshot['pipes']]
+                       + [1])
+        for stats in snapshot['pipes']:
+            # The graph may have been edited since the run started.
+            try:
+                start = component_list[stats['start']]
+                pipe = self.pipes[start.output_pipes[stats['start_port']]]
+            except (IndexError, KeyError):
+                continue
+            pipe.set_metrics(stats['lines_per_sec'] / top_rate, stats['fill'])
+
+        for stats in snapshot['components']:
+            node = self.nodes.get(component_list[stats['id']])
+            if node is not None:
+                self.set_badge(node, self.format_badge(stats))
+
+        self.app.builder.get_object(ID_CANVAS).queue_draw()
+
+    def clear_metrics(self):
+        for pipe in self.pipes.values():
+            pipe.clear_metrics()
+        for node in self.nodes.values():
+            self.set_badge(node, None)
+        self.app.builder.get_object(ID_CANVAS).queue_draw()
+
+    @staticmethod
+    def format_badge(stats):
+        if stats['cached']:
+            return 'Cached'
+        parts = []
+        if stats['cpu'] is not None:
+            parts.append('{:.0f}% CPU'.format(stats['cpu']))
+        if stats['rss'] is not None:
+            parts.append('{:.0f} MB'.format(stats['rss'] / 2 ** 20))
+        return ', '.join(parts) or None
+
+    def set_badge(self, node, badge):
+        node.badge = badge
+        if node.box is not None:
+            drawer = node.box.get_children()[0]
+            drawer.badge = badge
+            drawer.queue_draw()
+
+    def set_highlight(self, node, is_selected):
+        node.is_selected = is_selected
+        if node.box is not None:
+            node.box.get_children()[0].is_selected = is_selected
+        self.queue_draw_boxes([node.get_box()])
+
+    def toggle_selected(self, node):
+        if node in self.selection:
+            self.selection.remove(node)
+        else:
+            self.selection.add(node)
+        self.set_highlight(node, node in self.selection)
+
+    def clear_selection(self):
+        for node in self.selection:
+            self.set_highlight(node, False)
+        self.selection = set()
+
+    def start_drag(self, node, event):
+        nodes = self.selection if node in self.selection else [node]
+        self.drag_nodes = [(n, n.x, n.y) for n in nodes]
+        self.drag_origin = self.drag_pointer = (event.x_root, event.y_root)
+
+    def end_drag(self):
+        if self.drag_tick is not None:
+            canvas = self.app.builder.get_object(ID_CANVAS)
+            canvas.remove_tick_callback(self.drag_tick)
+            self.drag_tick = None
+            self.apply_drag()
+        self.drag_nodes = []
+
+    def do_motion(self, canvas, event):
+        # Motion events can arrive faster than frames, so only the latest
+        # pointer position is kept, and applied once per frame.
+        if self.drag_nodes:
+            self.drag_pointer = (event.x_root, event.y_root)
+            if self.drag_tick is None:
+                self.drag_tick = canvas.add_tick_callback(self.do_drag_tick)
+        elif self.pan_origin is not None:
+            x, y, view_x, view_y = self.pan_origin
+            self.view_x = view_x - (event.x_root - x) / self.zoom
+            self.view_y = view_y - (event.y_root - y) / self.zoom
+            canvas.queue_draw()
+
+    def do_scroll(self, canvas, event):
+        '''Zooms about the pointer with Ctrl held, otherwise pans.
+
+        Zooming a canvas of widgets first turns it into a virtual one, as
+        widgets cannot be scaled.'''
+        if event.direction == Gdk.ScrollDirection.UP:
+            step = 1
+        elif event.direction == Gdk.ScrollDirection.DOWN:
+            step = -1
+        else:
+            return False
+
+        if event.state & Gdk.ModifierType.CONTROL_MASK:
+            self.set_zoom_level(self.zoom_level + step, event.x, event.y)
+        elif self.virtual:
+            self.view_y -= step * self.SCROLL_STEP / self.zoom
+            canvas.queue_draw()
+        return True
+
+    def set_zoom_level(self, level, x, y):
+        level = max(self.MIN_ZOOM_LEVEL, min(self.MAX_ZOOM_LEVEL, level))
+        if level == self.zoom_level:
+            return
+        if not self.virtual:
+            self.make_virtual()
+
+        # The canvas point under the pointer stays where it is.
+        canvas_x, canvas_y = self.to_canvas(x, y)
+        self.zoom_level = level
+        self.zoom = self.ZOOM_STEP ** level
+        self.view_x = canvas_x - x / self.zoom
+        self.view_y = canvas_y - y / self.zoom
+        self.app.builder.get_object(ID_CANVAS).queue_draw()
+
+    def make_virtual(self):
+        self.end_drag()
+        for node in self.nodes.values():
+            if node.box is not None:
+                node.box.destroy()
+                node.box = None
+        self.pending_nodes = []
+        self.virtual = True
+
+    def to_canvas(self, x, y):
+        'Converts a position in the canvas window to canvas coordinates.'
+        return x / self.zoom + self.view_x, y / self.zoom + self.view_y
+
+    def do_drag_tick(self, canvas, frame_clock):
+        self.drag_tick = None
+        self.apply_drag()
+        return False
+
+    def apply_drag(self):
+        canvas = self.app.builder.get_object(ID_CANVAS)
+        dx = int((self.drag_pointer[0] - self.drag_origin[0]) / self.zoom)
+        dy = int((self.drag_pointer[1] - self.drag_origin[1]) / self.zoom)
+
+        # Every node moves before GTK lays the canvas out again, and only
+        # where the nodes and their pipes were and now are gets redrawn.
+        damage = []
+        for node, x, y in self.drag_nodes:
+            damage.extend(self.get_node_boxes(node))
+            node.x = x + dx
+            node.y = y + dy
+            self.node_index.insert(node, node.get_box())
+            if node.box is not None:
+                canvas.move(node.box, node.x, node.y)
+            self.update_pipes(node.component)
+            damage.extend(self.get_node_boxes(node))
+
+        self.queue_draw_boxes(damage)
+
+    def queue_draw_boxes(self, boxes):
+        canvas = self.app.builder.get_object(ID_CANVAS)
+        for x1, y1, x2, y2 in boxes:
+            x1 = int(math.floor((x1 - self.view_x) * self.zoom))
+            y1 = int(math.floor((y1 - self.view_y) * self.zoom))
+            x2 = int(math.ceil((x2 - self.view_x) * self.zoom))
+            y2 = int(math.ceil((y2 - self.view_y) * self.zoom))
+            canvas.queue_draw_area(x1, y1, x2 - x1 + 1, y2 - y1 + 1)
+
+    def get_node_boxes(self, node):
+        boxes = [node.get_box()]
+        component = node.component
+        for pipe in component.input_pipes + component.output_pipes:
+            boxes.extend(self.pipes[pipe].get_segment_boxes())
+        return boxes
+
+    def show_properties(self, component):
+        if component.properties_dialog is None:
+            return
+
+        try:
+            template = self.dialog_templates[component.__class__]
+        except KeyError:
+            template = DialogTemplate(component.properties_dialog)
+            self.dialog_templates[component.__class__] = template
+
+        dialog = Gtk.Dialog(component.name + ' Properties',
+                            self.app.builder.get_object(ID_MAIN_WINDOW),
+                            Gtk.DialogFlags.MODAL
+                                | Gtk.DialogFlags.DESTROY_WITH_PARENT,
+                            (Gtk.STOCK_OK, Gtk.ResponseType.OK))
+
+        content_area = dialog.get_content_area()
+        content_area.pack_start(template.box, False, False, 0)
+        template.attach(component)
+
+        content_area.show_all()
+
+        response = dialog.run()
+        print('Response:', response)
+
+        # The template outlives the dialog, for the next component of its
+        # type.
+        template.attach(None)
+        content_area.remove(template.box)
+        dialog.destroy()
+
+        # Properties such as a Split's output count move the ports.
+        self.update_pipes(component)
+        self.app.builder.get_object(ID_CANVAS).queue_draw()
+
+    def add_pipe(self, start_node, end_node):
+        try:
+            pipe = components.Pipe(start_node.component, end_node.component)
+        except components.FullPipeError:
+            return
+        self.pipes[pipe] = PipeDrawer(pipe, start_node, end_node)
+        self.index_pipe(self.pipes[pipe])
+
+    def remove_pipe(self, start_node, end_node):
+        for pipe in self.pipes.values():
+            if pipe.start_node is start_node and pipe.end_node is end_node:
+                pipe.pipe.detach()
+                del self.pipes[pipe.pipe]
+                self.unindex_pipe(pipe)
+
+                # Later pipes on the same components shift up a port.
+                self.update_pipes(pipe.start)
+                self.update_pipes(pipe.end)
+                return
+
+    def find_pipe(self, start, end):
+        for pipe in self.pipes.values():
+            if pipe.start is start and pipe.end is end:
+                return pipe
+        return None
+
+    def index_pipe(self, pipe):
+        pipe.update_geometry()
+        for n, box in enumerate(pipe.get_segment_boxes()):
+            self.pipe_index.insert((pipe, n), box)
+
+    def unindex_pipe(self, pipe):
+        for n in range(len(pipe.points) - 1):
+            self.pipe_index.remove((pipe, n))
+
+    def update_pipes(self, component):
+        for pipe in component.input_pipes + component.output_pipes:
+            self.index_pipe(self.pipes[pipe])
+
+    def do_drag_received(self, canvas, context, x, y, data, info, time):
+        component = self.app.components[data.get_text()]
+        Gtk.drag_finish(context, True, False, time)
+
+        x, y = self.to_canvas(x, y)
+        node = self.add_node(component(),
+                             x - ComponentDrawer.CANVAS_WIDTH / 2,
+                             y - ComponentDrawer.CANVAS_HEIGHT/ 2)
+        if not self.virtual:
+            self.create_widget(node)
+
+        canvas.get_window().invalidate_rect(None, True)
+
+    def add_node(self, component, x, y):
+        node = Node(component, int(x), int(y), len(self.nodes))
+        self.nodes[component] = node
+        self.node_index.insert(node, node.get_box())
+        return node
+
+    def create_widget(self, node):
+        event_box = Gtk.EventBox()
+        event_box.set_visible_window(False)
+        event_box.add_events(Gdk.EventMask.POINTER_MOTION_HINT_MASK
+                        | Gdk.EventMask.BUTTON_MOTION_MASK
+                        | Gdk.EventMask.BUTTON_PRESS_MASK
+                        | Gdk.EventMask.BUTTON_RELEASE_MASK)
+        event_box.connect('button-press-event', self.do_child_press)
+        event_box.connect('button-release-event', self.do_child_release)
+        event_box.node = node
+
+        drawer = ComponentDrawer(self.app.builder, node.component, False)
+        drawer.is_selected = node.is_selected
+        drawer.badge = node.badge
+        event_box.add(drawer)
+        drawer.set_visible(True)
+        event_box.set_visible(True)
+        self.app.builder.get_object(ID_CANVAS).put(event_box, node.x, node.y)
+
+        node.box = event_box
+
+    def load(self, component_list, positions):
+        'Replaces the canvas contents with a graph read by graph.load.'
+        self.clear()
+        self.virtual = (self.force_virtual
+                        or len(component_list) > self.VIRTUAL_NODES)
+
+        for i, (component, position) in enumerate(zip(component_list,
+                                                      positions)):
+            if position is None:
+                column = i % self.LAYOUT_COLUMNS
+                row = i // self.LAYOUT_COLUMNS
+                position = (column * (ComponentDrawer.CANVAS_WIDTH
+                                      + self.GRID_SPACING),
+                            row * (ComponentDrawer.CANVAS_HEIGHT
+                                   + self.GRID_SPACING))
+            self.add_node(component, *position)
+
+        for component in component_list:
+            for pipe in component.output_pipes:
+                self.pipes[pipe] = PipeDrawer(pipe, self.nodes[pipe.start],
+                                              self.nodes[pipe.end])
+                self.index_pipe(self.pipes[pipe])
+
+        # Pipes draw straight from the nodes, so the first frame does not
+        # wait for thousands of widgets.  Those are created top-left first,
+        # a batch at a time, whenever the main loop is idle.
+        if not self.virtual:
+            self.pending_nodes = sorted(self.nodes.values(),
+                                        key=lambda node: (node.y, node.x),
+                                        reverse=True)
+            GObject.idle_add(self.create_pending_widgets)
+
+        self.app.builder.get_object(ID_CANVAS).queue_draw()
+
+    def create_pending_widgets(self):
+        for i in range(min(self.WIDGET_BATCH, len(self.pending_nodes))):
+            self.create_widget(self.pending_nodes.pop())
+        return bool(self.pending_nodes)
+
+    def clear(self):
+        for node in self.nodes.values():
+            if node.box is not None:
+                node.box.destroy()
+
+        self.nodes = {}
+        self.node_index.clear()
+        self.pending_nodes = []
+        self.pipes = {}
+        self.pipe_index.clear()
+        self.view_x = 0
+        self.view_y = 0
+        self.zoom_level = 0
+        self.zoom = 1
+        self.pan_origin = None
+        self.selection = set()
+        self.drag_nodes = []
+        self.add_pipe_node = None
+        self.remove_pipe_node = None
+
+    def get_components(self):
+        return list(self.nodes)
+
+    def get_positions(self):
+        return [(node.x, node.y) for node in self.nodes.values()]
+
+    def do_draw(self, canvas, ctx):
+        # Positions are canvas coordinates; in virtual mode the view can
+        # pan and zoom, so the canvas shows a window onto them.
+        ctx.scale(self.zoom, self.zoom)
+        ctx.translate(-self.view_x, -self.view_y)
+        clip = ctx.clip_extents()
+        detailed = self.zoom >= self.DETAIL_ZOOM
+
+        if detailed:
+            self.draw_background(ctx, clip)
+        else:
+            ctx.set_source_rgb(1, 1, 1)
+            ctx.paint()
+
+        # Only pipes with a segment in the damaged region are redrawn.
+        pipes = set(pipe for pipe, n in self.pipe_index.query(clip))
+        if detailed:
+            for pipe in pipes:
+                ctx.save()
+                pipe.do_draw(ctx)
+                ctx.restore()
+        else:
+            PipeDrawer.draw_outlines(ctx, pipes)
+
+        if self.virtual:
+            nodes = self.node_index.query(clip)
+            if detailed:
+                self.draw_nodes(ctx, nodes, canvas.get_scale_factor())
+            else:
+                self.draw_node_outlines(ctx, nodes)
+
+    def draw_nodes(self, ctx, nodes, scale):
+        for node in sorted(nodes, key=lambda node: node.depth):
+            ctx.save()
+            ctx.translate(node.x, node.y)
+            node.paint(ctx, node.CANVAS_WIDTH, node.CANVAS_HEIGHT, scale,
+                       self.zoom)
+            ctx.restore()
+
+    @staticmethod
+    def draw_node_outlines(ctx, nodes):
+        'Draws nodes as plain boxes, with one fill per color.'
+        margin = Node.BASE_MARGIN
+        width = Node.CANVAS_WIDTH - margin * 2
+        height = Node.CANVAS_HEIGHT - margin * 2
+        for is_selected, color in ((False, Node.BASE_FILL_COLOR),
+                                   (True, Node.BASE_FILL_COLOR_SELECTED)):
+            for node in nodes:
+                if node.is_selected == is_selected:
+                    ctx.rectangle(node.x + margin, node.y + margin, width,
+                                  height)
+            ctx.set_source_rgb(*color)
+            ctx.fill()
+
+    def draw_background(self, ctx, clip):
+        # The background and grid repeat every GRID_SPACING pixels, so they
+        # are drawn once into a tile, and each frame only fills whatever the
+        # clip region leaves of the canvas from it.
+        scale = self.app.builder.get_object(ID_CANVAS).get_scale_factor()
+        if self.background is None or self.background_scale != scale:
+            self.background = self.make_background(ctx.get_target())
+            self.background_scale = scale
+
+        ctx.save()
+        ctx.set_source(self.background)
+        x1, y1, x2, y2 = clip
+        ctx.rectangle(x1, y1, x2 - x1, y2 - y1)
+        ctx.fill()
+        ctx.restore()
+
+    def make_background(self, target):
+        spacing = self.GRID_SPACING
+        tile = target.create_similar(cairo.CONTENT_COLOR, spacing, spacing)
+
+        ctx = cairo.Context(tile)
+        ctx.set_source_rgb(1, 1, 1)
+        ctx.paint()
+
+        # A line on each edge of the tile draws the half of a grid line that
+        # falls inside it; neighbouring tiles supply the other half.  The
+        # spacing is a whole number of dashes, so the dashes line up too.
+        ctx.set_line_width(self.GRID_WIDTH)
+        ctx.set_source_rgb(0, 0, 0)
+        ctx.set_dash((self.GRID_LENGTH,))
+        for edge in (0, spacing):
+            ctx.move_to(edge, 0)
+            ctx.line_to(edge, spacing)
+            ctx.move_to(0, edge)
+            ctx.line_to(spacing, edge)
+        ctx.stroke()
+
+        pattern = cairo.SurfacePattern(tile)
+        pattern.set_extend(cairo.EXTEND_REPEAT)
+        return pattern
+
+class Plumber(object):
+    def __init__(self, virtual=False, timings=False, result_cache=None):
+        self.virtual = virtual
+        self.timings = timings
+        self.result_cache = result_cache
+        self.mark('imports')
+
+        self.builder = Gtk.Builder()
+        self.builder.add_from_file(UI_FILE)
+        self.mark('interface')
+
+        self.components = registry.get_components()
+        self.mark('component registry')
+
+        self.init_ui()
+        self.mark('init_ui')
+
+    def mark(self, stage):
+        'Reports how long after startup a stage finished, if asked to.'
+        if self.timings:
+            sys.stderr.write('plumber: {:8.1f} ms  {}\n'.format(
+                    (time.time() - START_TIME) * 1000, stage))
+
+    def start(self):
+        main_window = self.builder.get_object(ID_MAIN_WINDOW)
+        self.first_draw = main_window.connect('draw', self.do_first_draw)
+        main_window.show_all()
+
+    def do_first_draw(self, widget, ctx):
+        widget.disconnect(self.first_draw)
+        self.mark('first frame')
+
+    def init_ui(self):
+        'Wires the UI XML description to the actual implementing code.'
+        main_window = self.builder.get_object(ID_MAIN_WINDOW)
+        main_window.connect('destroy', Gtk.main_quit)
+
+        # Cached component sprites go stale when the theme or scale changes.
+        settings = Gtk.Settings.get_default()
+        settings.connect('notify::gtk-theme-name', self.do_appearance_changed)
+        main_window.connect('notify::scale-factor', self.do_appearance_changed)
+
+        self.toolbar = Toolbar(self)
+        self.toolbar.init_ui()
+
+        self.component_palette = ComponentPalette(self)
+        self.component_palette.init_ui()
+
+        self.canvas = Canvas(self, self.virtual)
+        self.canvas.init_ui()
+
+    def do_appearance_changed(self, obj, pspec):
+        ComponentDrawer.sprite_cache.clear()
+        self.builder.get_object(ID_MAIN_WINDOW).queue_draw()
+
+def main(argv):
+    GObject.threads_init()
+    p = Plumber(virtual='--virtual' in argv[1:],
+                timings='--timings' in argv[1:],
+                result_cache=(cache.ResultCache() if '--cache' in argv[1:]
+                              else None))
+    p.start()
+    Gtk.main()
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,128 @@
+from __future__ import division
+
+import os
+import time
+
+# CPU and memory figures come from /proc, so they are None on systems
+# without it.
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError):
+    CLOCK_TICKS = PAGE_SIZE = None
+
+def thread_cpu(tid):
+    'Returns the CPU seconds used by a thread of this process, or None.'
+    if tid is None or CLOCK_TICKS is None:
+        return None
+    try:
+        with open('/proc/self/task/{}/stat'.format(tid)) as f:
+            stat = f.read()
+    except IOError:
+        return None
+
+    # The command name can hold spaces, so fields are counted from after it.
+    fields = stat[stat.rindex(')') + 2:].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+def process_usage(pid):
+    '''Returns the CPU seconds and resident bytes used by another process,
+    or Nones.'''
+    if CLOCK_TICKS is None:
+        return None, None
+    try:
+        with open('/proc/{}/stat'.format(pid)) as f:
+            stat = f.read()
+    except IOError:
+        return None, None
+
+    fields = stat[stat.rindex(')') + 2:].split()
+    return ((int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+            int(fields[21]) * PAGE_SIZE)
+
+def process_cpu():
+    'Returns the CPU seconds used by this process.'
+    times = os.times()
+    return times[0] + times[1]
+
+def process_rss():
+    'Returns the resident memory of this process in bytes, or None.'
+    if PAGE_SIZE is None:
+        return None
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except IOError:
+        return None
+
+class Sampler(object):
+    '''Turns a running Pipeline's counters into rates.
+
+    Each call to sample returns a snapshot, ready to be written as JSON:
+
+        {"time": seconds since the first sample,
+         "rss": bytes used by this process,
+         "components": [{"id", "name", "running", "cached", "cpu", "rss"}],
+         "pipes": [{"start", "start_port", "end", "end_port", "lines",
+                    "bytes", "lines_per_sec", "bytes_per_sec", "fill"}]}
+
+    Components are numbered in pipeline order, and pipes are identified as
+    in graph files.  cached is true for components replaying their outputs
+    from the result cache.  cpu is the percentage of one core used since the
+    last sample.  A component's rss only counts its worker processes, as the
+    rest share this one.'''
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.start = self.last_time = time.time()
+        self.last_cpu = {}
+        self.last_counts = {}
+
+    def sample(self):
+        now = time.time()
+        elapsed = max(now - self.last_time, 1e-6)
+        self.last_time = now
+
+        pipeline = self.pipeline
+        index = dict((component, i)
+                     for i, component in enumerate(pipeline.components))
+
+        component_stats = []
+        for i, component in enumerate(pipeline.components):
+            cpu, rss = pipeline.get_usage(component)
+            last = self.last_cpu.get(component)
+            self.last_cpu[component] = cpu
+            component_stats.append({
+                'id': i,
+                'name': component.name,
+                'running': pipeline.is_component_running(component),
+                'cached': component in pipeline.cached,
+                'cpu': (None if cpu is None or last is None
+                        else max(cpu - last, 0) / elapsed * 100),
+                'rss': rss,
+            })
+
+        pipe_stats = []
+        for pipe, channel in pipeline.channels.items():
+            counts = (channel.lines, channel.bytes)
+            last = self.last_counts.get(pipe, (0, 0))
+            self.last_counts[pipe] = counts
+            start_port, end_port = pipeline.ports[pipe]
+            pipe_stats.append({
+                'start': index[pipe.start],
+                'start_port': start_port,
+                'end': index[pipe.end],
+                'end_port': end_port,
+                'lines': counts[0],
+                'bytes': counts[1],
+                'lines_per_sec': (counts[0] - last[0]) / elapsed,
+                'bytes_per_sec': (counts[1] - last[1]) / elapsed,
+                'fill': channel.fill(),
+            })
+
+        return {
+            'time': now - self.start,
+            'rss': process_rss(),
+            'components': component_stats,
+            'pipes': pipe_stats,
+        }
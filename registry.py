@@ -0,0 +1,88 @@
+'''Finds the component types available to graphs and the palette.
+
+Besides the built in components, any installed package can add its own
+through the "plumber.components" entry point group:
+
+    entry_points={
+        'plumber.components': [
+            'Text/Sort = mypackage.sort:SortComponent',
+        ],
+    }
+
+The entry point name is the palette category and the component name, with
+a slash between them, or just the component name to list it under Plugins.
+A plugin's module is only imported once something needs more than its name
+and category.'''
+
+import sys
+
+import components
+
+ENTRY_POINT_GROUP = 'plumber.components'
+PLUGIN_CATEGORY = 'Plugins'
+
+_components = None
+
+class ComponentEntry(object):
+    '''Stands in for a plugin component class until it is first used.
+
+    Calling an entry creates a component, and any other attribute comes from
+    the class, which is imported then.'''
+
+    def __init__(self, name, category, entry_point):
+        self.name = name
+        self.category = category
+        self.entry_point = entry_point
+        self.cls = None
+
+    def load(self):
+        if self.cls is None:
+            self.cls = self.entry_point.load()
+        return self.cls
+
+    def __call__(self):
+        return self.load()()
+
+    def __getattr__(self, name):
+        # Only called for attributes the entry itself does not have.
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.load(), name)
+
+def iter_entry_points():
+    try:
+        from importlib import metadata
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return []
+        return list(pkg_resources.iter_entry_points(ENTRY_POINT_GROUP))
+
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, 'select'):
+        return list(entry_points.select(group=ENTRY_POINT_GROUP))
+    return list(entry_points.get(ENTRY_POINT_GROUP, ()))
+
+def get_components():
+    '''Returns a dict of every component type, by name.
+
+    Values are component classes, or ComponentEntry objects for plugins.
+    Built in components win over plugins with the same name.'''
+    global _components
+    if _components is not None:
+        return _components
+
+    found = dict((c.name, c) for c in components.ACTIVE_COMPONENTS)
+    for entry_point in iter_entry_points():
+        category, _, name = entry_point.name.rpartition('/')
+        if name in found:
+            sys.stderr.write('plumber: ignoring plugin {}, which has the '
+                             'name of another component\n'.format(
+                                     entry_point.name))
+            continue
+        found[name] = ComponentEntry(name, category or PLUGIN_CATEGORY,
+                                     entry_point)
+
+    _components = found
+    return _components
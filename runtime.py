@@ -0,0 +1,773 @@
+from __future__ import division
+
+import os
+import sys
+import json
+import time
+import pickle
+import signal
+import ctypes
+import argparse
+import threading
+import multiprocessing
+from collections import deque
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+import cache
+import graph
+import fileio
+import metrics
+
+# Lines are handed between stages in chunks, and each pipe buffers at most
+# QUEUE_SIZE chunks, so a slow consumer applies backpressure to its producer.
+CHUNK_SIZE = 1024
+QUEUE_SIZE = 16
+
+# How often blocked stages wake up to check for cancellation, in seconds.
+POLL_INTERVAL = 0.1
+
+# Bytes each pipe holds when every component runs in its own process.
+RING_SIZE = 4 << 20
+
+# Seconds a worker process has to stop once a run is cancelled, before it
+# is terminated.
+STOP_TIMEOUT = 2
+
+class Cancelled(Exception): pass
+
+# The component a parallel worker process runs, set when the worker starts.
+_worker_component = None
+
+def _init_worker(component):
+    global _worker_component
+    _worker_component = component
+
+def _process_chunk(lines):
+    # Workers report their own usage along with each result.
+    return (os.getpid(), metrics.process_cpu(), metrics.process_rss(),
+            _worker_component.process_chunk(lines))
+
+class Channel(object):
+    'A bounded in-memory stream of line chunks between two components.'
+
+    def __init__(self, cancel_event, maxsize=QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize)
+        self.maxsize = maxsize
+        self.cancel_event = cancel_event
+        self.abandoned = False
+        self.lines = 0
+        self.bytes = 0
+
+    def put(self, chunk):
+        if chunk is not None:
+            self.lines += len(chunk)
+            self.bytes += sum(map(len, chunk))
+
+        while not self.abandoned:
+            if self.cancel_event.is_set():
+                raise Cancelled()
+            try:
+                self.queue.put(chunk, timeout=POLL_INTERVAL)
+                return
+            except queue.Full:
+                pass
+
+    def get(self):
+        while True:
+            if self.cancel_event.is_set():
+                raise Cancelled()
+            try:
+                return self.queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                pass
+
+    def fill(self):
+        'Returns how full the channel is, from 0 to 1.'
+        return self.queue.qsize() / self.maxsize
+
+class RingChannel(object):
+    '''A Channel in shared memory, between two worker processes.
+
+    Lines are encoded into a ring buffer of capacity bytes.  The writer
+    copies each chunk in and the reader copies out all there is, and either
+    only takes a lock to move the counters and wake the other, so a hop
+    costs no system calls while the ring is neither empty nor full.  A full
+    ring blocks the writer, which carries backpressure upstream as Channel
+    does.  Lines that lack a newline run into the next, as in a shell
+    pipe.'''
+
+    # Indexes into the shared counters.
+    WRITTEN, READ, LINES, CLOSED, ABANDONED = range(5)
+
+    def __init__(self, cancel_event, context, capacity=RING_SIZE):
+        self.cancel_event = cancel_event
+        self.capacity = capacity
+        self.data = context.RawArray(ctypes.c_char, capacity)
+        self.view = memoryview(self.data).cast('B')
+        self.counters = context.RawArray(ctypes.c_uint64, 5)
+        self.condition = context.Condition()
+        self.lines_read = None
+
+    @property
+    def lines(self):
+        return self.counters[self.LINES]
+
+    @property
+    def bytes(self):
+        return self.counters[self.WRITTEN]
+
+    @property
+    def abandoned(self):
+        return bool(self.counters[self.ABANDONED])
+
+    @abandoned.setter
+    def abandoned(self, value):
+        with self.condition:
+            self.counters[self.ABANDONED] = value
+            self.condition.notify_all()
+
+    def wait(self):
+        # Called holding the lock.
+        if self.cancel_event.is_set():
+            raise Cancelled()
+        self.condition.wait(POLL_INTERVAL)
+
+    def put(self, chunk):
+        counters = self.counters
+        if chunk is None:
+            with self.condition:
+                counters[self.CLOSED] = 1
+                self.condition.notify_all()
+            return
+
+        data = memoryview(''.join(chunk).encode(fileio.ENCODING))
+        lines = len(chunk)
+        while len(data):
+            with self.condition:
+                while (counters[self.WRITTEN] - counters[self.READ]
+                       == self.capacity and not counters[self.ABANDONED]):
+                    self.wait()
+                if counters[self.ABANDONED]:
+                    return
+                written = counters[self.WRITTEN]
+                free = self.capacity - (written - counters[self.READ])
+
+            # Only this process moves the write counter, and the reader
+            # leaves the free space alone until it does.
+            size = min(free, len(data))
+            start = written % self.capacity
+            first = min(size, self.capacity - start)
+            self.view[start:start + first] = data[:first]
+            self.view[:size - first] = data[first:size]
+            data = data[size:]
+
+            with self.condition:
+                counters[self.WRITTEN] = written + size
+                if not len(data):
+                    counters[self.LINES] += lines
+                self.condition.notify_all()
+
+    def read(self):
+        '''Returns the bytes written since the last read, or None once the
+        writer has closed the channel.'''
+        counters = self.counters
+        with self.condition:
+            while (counters[self.WRITTEN] == counters[self.READ]
+                   and not counters[self.CLOSED]):
+                self.wait()
+            read = counters[self.READ]
+            size = counters[self.WRITTEN] - read
+        if not size:
+            return None
+
+        start = read % self.capacity
+        first = min(size, self.capacity - start)
+        data = self.view[start:start + first].tobytes()
+        if first < size:
+            data += self.view[:size - first].tobytes()
+
+        with self.condition:
+            counters[self.READ] = read + size
+            self.condition.notify_all()
+        return data
+
+    def read_blocks(self):
+        while True:
+            data = self.read()
+            if data is None:
+                return
+            yield data
+
+    def get(self):
+        if self.lines_read is None:
+            self.lines_read = fileio.split_lines(self.read_blocks())
+        return next(self.lines_read, None)
+
+    def fill(self):
+        counters = self.counters
+        return (counters[self.WRITTEN] - counters[self.READ]) / self.capacity
+
+class Reader(object):
+    def __init__(self, channel):
+        self.channel = channel
+
+    def chunks(self):
+        while True:
+            chunk = self.channel.get()
+            if chunk is None:
+                return
+            yield chunk
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            for line in chunk:
+                yield line
+
+    def close(self):
+        # Producers stop blocking on a consumer that has finished early.
+        self.channel.abandoned = True
+
+class Writer(object):
+    def __init__(self, channel, chunk_size=CHUNK_SIZE):
+        self.channel = channel
+        self.chunk_size = chunk_size
+        self.buffer = []
+
+    def write(self, line):
+        self.buffer.append(line)
+        if len(self.buffer) >= self.chunk_size:
+            self.flush()
+
+    def write_chunk(self, lines):
+        if self.buffer:
+            self.flush()
+        if lines:
+            self.channel.put(lines)
+
+    def flush(self):
+        self.channel.put(self.buffer)
+        self.buffer = []
+
+    def close(self):
+        if self.buffer:
+            self.flush()
+        self.channel.put(None)
+
+class RecordingWriter(object):
+    'Writes to an output port and to the cache entry that keeps it.'
+
+    def __init__(self, port, entry):
+        self.port = port
+        self.entry = entry
+
+    def write(self, line):
+        self.port.write(line)
+        self.entry.write(line)
+
+    def write_chunk(self, lines):
+        self.port.write_chunk(lines)
+        self.entry.writelines(lines)
+
+    def close(self):
+        self.port.close()
+
+class NullReader(object):
+    'Stands in for an input port that has no pipe attached.'
+
+    def chunks(self):
+        return iter(())
+
+    def __iter__(self):
+        return iter(())
+
+    def close(self):
+        pass
+
+class NullWriter(object):
+    'Stands in for an output port that has no pipe attached.'
+
+    def write(self, line):
+        pass
+
+    def write_chunk(self, lines):
+        pass
+
+    def close(self):
+        pass
+
+class Pipeline(object):
+    '''Runs a graph of components in-process.
+
+    Every component runs in its own thread, and every pipe becomes a bounded
+    Channel instead of a FIFO.
+
+    Given a cache.ResultCache, the outputs of components are kept in it, and
+    components whose outputs are already kept replay them instead of
+    running.  Components only needed to feed those do not run at all.'''
+
+    def __init__(self, components, result_cache=None):
+        self.components = list(components)
+        self.result_cache = result_cache
+        self.cancel_event = threading.Event()
+        self.threads = {}
+        self.errors = []
+        self.channels = {}
+        self.ports = {}
+        self.thread_ids = {}
+        self.worker_usage = {}
+        self.cached = set()
+
+    def start(self, on_finish=None):
+        keys = {}
+        kept = {}
+        if self.result_cache is not None:
+            keys = cache.get_keys(self.components)
+            kept = self.find_kept(keys)
+        needed = self.find_needed(kept)
+        self.cached = set(kept) & needed
+
+        # A file copied unchanged to another never becomes lines, and is
+        # copied by one thread for both components, as cat copies it in
+        # compiled scripts.
+        channels = self.channels
+        copies = {}
+        for component in self.components:
+            for pipe in component.output_pipes:
+                if pipe.end not in needed or pipe.end in self.cached:
+                    continue
+                if (pipe.start.get_source() is not None
+                        and pipe.end.get_sink() is not None):
+                    copies[pipe.start] = copies[pipe.end] = pipe
+                else:
+                    channels[pipe] = self.make_channel()
+                    # Pipes removed from the graph during the run lose
+                    # their ports.
+                    self.ports[pipe] = (pipe.start.output_pipes.index(pipe),
+                                        pipe.end.input_pipes.index(pipe))
+
+        for component in self.components:
+            if component not in needed:
+                continue
+
+            if component in self.cached:
+                outputs = self.make_ports(component.output_pipes,
+                                          component.outputs, channels,
+                                          self.make_writer, NullWriter)
+                self.threads[component] = self.spawn(
+                        self.run_cached, (component, outputs, kept[component]))
+                continue
+
+            pipe = copies.get(component)
+            if pipe is not None:
+                if component is pipe.start:
+                    self.threads[pipe.start] = self.threads[pipe.end] = (
+                            self.spawn(self.run_copy, (pipe,)))
+                continue
+
+            inputs = self.make_ports(component.input_pipes, component.inputs,
+                                     channels, Reader, NullReader)
+            outputs = self.make_ports(component.output_pipes,
+                                      component.outputs, channels,
+                                      self.make_writer, NullWriter)
+
+            # Outputs of components with no inputs are as quick to make
+            # again as to replay.
+            key = None
+            if component.inputs and component.output_pipes:
+                key = keys.get(component)
+
+            self.threads[component] = self.spawn(
+                    self.run_component, (component, inputs, outputs, key))
+
+        for thread in set(self.threads.values()):
+            thread.start()
+
+        if on_finish is not None:
+            watcher = threading.Thread(target=self.watch, args=(on_finish,))
+            watcher.daemon = True
+            watcher.start()
+
+    def make_channel(self):
+        return Channel(self.cancel_event)
+
+    def make_writer(self, channel):
+        return Writer(channel)
+
+    def spawn(self, target, args):
+        'Returns a thread, not yet started, that calls target with args.'
+        thread = threading.Thread(target=target, args=args)
+        thread.daemon = True
+        return thread
+
+    def fail(self, component, error):
+        'Records why a component failed, and stops the run.'
+        self.errors.append((component, error))
+        self.cancel()
+
+    def find_kept(self, keys):
+        '''Returns a dict of the kept output files of each component whose
+        outputs are all kept.'''
+        kept = {}
+        for component, key in keys.items():
+            if not component.inputs or not component.output_pipes:
+                continue
+            paths = [self.result_cache.lookup(key, port)
+                     for port in range(len(component.output_pipes))]
+            if None not in paths:
+                kept[component] = paths
+        return kept
+
+    def find_needed(self, kept):
+        '''Returns the components that have to run or replay their outputs.
+
+        Those are the components with no output pipes, which are there for
+        what they do rather than what they output, and whatever feeds them,
+        up to the components that replay their outputs.'''
+        needed = set()
+        stack = [component for component in self.components
+                 if not component.output_pipes]
+        while stack:
+            component = stack.pop()
+            if component in needed:
+                continue
+            needed.add(component)
+            if component not in kept:
+                stack.extend(pipe.start for pipe in component.input_pipes)
+        return needed
+
+    @staticmethod
+    def make_ports(pipes, count, channels, port_class, null_class):
+        ports = []
+        for i in range(count):
+            if i < len(pipes) and pipes[i] in channels:
+                ports.append(port_class(channels[pipes[i]]))
+            else:
+                ports.append(null_class())
+        return ports
+
+    def run_component(self, component, inputs, outputs, key=None):
+        # Python 2 and early Python 3 cannot name the OS thread, so those
+        # only measure CPU for worker processes.
+        get_native_id = getattr(threading, 'get_native_id', None)
+        if get_native_id is not None:
+            self.thread_ids[component] = get_native_id()
+
+        entries = []
+        try:
+            if key is not None:
+                entries = [self.result_cache.create(key, port)
+                           for port in range(len(component.output_pipes))]
+                outputs = ([RecordingWriter(output, entry)
+                            for output, entry in zip(outputs, entries)]
+                           + outputs[len(entries):])
+
+            if component.stateless and component.parallelism > 1:
+                self.run_parallel(component, inputs, outputs)
+            else:
+                component.run(inputs, outputs)
+            for output in outputs:
+                output.close()
+
+            if entries:
+                for entry in entries:
+                    entry.commit()
+                self.result_cache.evict()
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.fail(component, e)
+        finally:
+            for input in inputs:
+                input.close()
+            for entry in entries:
+                entry.discard()
+
+    def run_cached(self, component, outputs, paths):
+        # A consumer may read the outputs in any order, so each is replayed
+        # by a thread of its own.
+        threads = []
+        for path, output in zip(paths, outputs):
+            thread = threading.Thread(target=self.replay,
+                                      args=(component, path, output))
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+
+    def replay(self, component, path, output):
+        try:
+            for lines in fileio.read_files([path]):
+                output.write_chunk(lines)
+            output.close()
+        except Cancelled:
+            pass
+        except Exception as e:
+            self.fail(component, e)
+
+    def run_copy(self, pipe):
+        get_native_id = getattr(threading, 'get_native_id', None)
+        if get_native_id is not None:
+            self.thread_ids[pipe.start] = get_native_id()
+
+        try:
+            fileio.copy_file(pipe.start.get_source(), pipe.end.get_sink(),
+                             lambda: self.cancelled)
+        except Exception as e:
+            self.fail(pipe.start, e)
+
+    def run_parallel(self, component, inputs, outputs):
+        '''Shards a stateless component's input across worker processes.
+
+        At most two chunks per worker are in flight at once, so a fast
+        producer cannot pull the whole input into memory.'''
+        pool = multiprocessing.Pool(component.parallelism, _init_worker,
+                                    (component,))
+        usage = self.worker_usage[component] = {}
+        try:
+            window = component.parallelism * 2
+            pending = deque()
+            for chunk in inputs[0].chunks():
+                pending.append(pool.apply_async(_process_chunk, (chunk,)))
+                if len(pending) >= window:
+                    self.write_results(outputs, self.next_result(
+                            pending, component.preserve_order, usage))
+
+            while pending:
+                self.write_results(outputs, self.next_result(
+                        pending, component.preserve_order, usage))
+        finally:
+            pool.terminate()
+
+    def next_result(self, pending, ordered, usage):
+        while True:
+            if self.cancel_event.is_set():
+                raise Cancelled()
+
+            for result in (pending[0],) if ordered else pending:
+                if result.ready():
+                    pending.remove(result)
+                    pid, cpu, rss, lines = result.get()
+                    usage[pid] = (cpu, rss)
+                    return lines
+            pending[0].wait(POLL_INTERVAL)
+
+    @staticmethod
+    def write_results(outputs, results):
+        for output, lines in zip(outputs, results):
+            output.write_chunk(lines)
+
+    def watch(self, on_finish):
+        self.wait()
+        on_finish(self)
+
+    def wait(self):
+        for thread in self.threads.values():
+            thread.join()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def is_running(self):
+        return any(thread.is_alive() for thread in self.threads.values())
+
+    def is_component_running(self, component):
+        thread = self.threads.get(component)
+        return thread is not None and thread.is_alive()
+
+    def get_usage(self, component):
+        '''Returns the CPU seconds and resident bytes used by a component.
+
+        Either is None when it cannot be measured.  The resident size only
+        counts worker processes, as a component's thread shares the memory
+        of the whole process.'''
+        cpu = metrics.thread_cpu(self.thread_ids.get(component))
+        workers = list(self.worker_usage.get(component, {}).values())
+        if not workers:
+            return cpu, None
+
+        cpu = (cpu or 0) + sum(worker_cpu for worker_cpu, rss in workers)
+        rss = [rss for worker_cpu, rss in workers if rss is not None]
+        return cpu, sum(rss) if rss else None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+class ProcessPipeline(Pipeline):
+    '''Runs a graph of components with a worker process for each.
+
+    Every pipe becomes a RingChannel of capacity bytes, which writers hand
+    batch lines at a time.  Unlike the threads of a Pipeline, which take
+    turns holding the interpreter lock, the workers use every core.  They
+    are forked, so this only runs on Unix systems.'''
+
+    def __init__(self, components, result_cache=None, capacity=RING_SIZE,
+                 batch=CHUNK_SIZE):
+        super(ProcessPipeline, self).__init__(components, result_cache)
+        self.context = multiprocessing.get_context('fork')
+        self.capacity = capacity
+        self.batch = batch
+        self.cancel_event = self.context.Event()
+        self.error_queue = self.context.Queue()
+        self.index = dict((component, i)
+                          for i, component in enumerate(self.components))
+        self.dead = set()
+
+    def make_channel(self):
+        return RingChannel(self.cancel_event, self.context, self.capacity)
+
+    def make_writer(self, channel):
+        return Writer(channel, self.batch)
+
+    def spawn(self, target, args):
+        # Workers are not daemons, so that components can start worker
+        # processes of their own.
+        return self.context.Process(target=self.run_worker,
+                                    args=(target, args))
+
+    @staticmethod
+    def run_worker(target, args):
+        # Ctrl+C cancels the run from the parent, which stops the workers.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        target(*args)
+
+    def fail(self, component, error):
+        # Called in a worker, so the error goes back to the parent.
+        try:
+            pickle.dumps(error)
+        except Exception:
+            error = RuntimeError(str(error))
+        self.error_queue.put((self.index[component], error))
+        self.cancel()
+
+    def check_workers(self):
+        '''Collects the errors of workers, and stops the run if one died
+        without saying why.'''
+        while True:
+            try:
+                index, error = self.error_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.errors.append((self.components[index], error))
+
+        failed = set(component for component, error in self.errors)
+        for component, process in self.threads.items():
+            if process.exitcode and process not in self.dead:
+                self.dead.add(process)
+                if component not in failed:
+                    self.errors.append((component, RuntimeError(
+                            'worker exited with status {}'.format(
+                                    process.exitcode))))
+                    self.cancel()
+
+    def wait(self):
+        deadline = None
+        for process in set(self.threads.values()):
+            while process.is_alive():
+                self.check_workers()
+                process.join(POLL_INTERVAL)
+                if deadline is None and self.cancel_event.is_set():
+                    deadline = time.time() + STOP_TIMEOUT
+                # A worker that died holding the lock of a pipe leaves its
+                # neighbours stuck waiting on it.
+                if deadline is not None and time.time() > deadline:
+                    process.terminate()
+                    process.join()
+                    self.dead.add(process)
+        self.check_workers()
+
+    def is_running(self):
+        self.check_workers()
+        return super(ProcessPipeline, self).is_running()
+
+    def get_usage(self, component):
+        '''Returns the CPU seconds and resident bytes used by a component's
+        worker, or Nones once it has finished.'''
+        process = self.threads.get(component)
+        if process is None or process.pid is None:
+            return None, None
+        return metrics.process_usage(process.pid)
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+            prog='plumber run',
+            description='Runs a saved graph without the graphical editor.')
+    parser.add_argument('graph', help='graph file to run')
+    parser.add_argument('--metrics', metavar='FILE',
+                        help='write a JSON metrics snapshot per line to FILE '
+                             '("-" for stderr)')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='seconds between metrics snapshots '
+                             '(default: %(default)s)')
+    parser.add_argument('--processes', action='store_true',
+                        help='run every component in its own process, with '
+                             'shared memory pipes between them')
+    parser.add_argument('--ring-size', metavar='MB', type=float,
+                        default=RING_SIZE / 2 ** 20,
+                        help='bytes each pipe holds with --processes, in MB '
+                             '(default: %(default)s)')
+    parser.add_argument('--batch', metavar='LINES', type=int,
+                        default=CHUNK_SIZE,
+                        help='lines written to a pipe at once with '
+                             '--processes (default: %(default)s)')
+    parser.add_argument('--cache', metavar='DIR', nargs='?', const='',
+                        help='keep the outputs of components in DIR, and '
+                             'replay those whose settings and inputs have '
+                             'not changed (default DIR: {})'.format(
+                                     cache.default_directory()))
+    parser.add_argument('--cache-size', metavar='GB', type=float,
+                        default=cache.DEFAULT_SIZE / 2 ** 30,
+                        help='size the cache is kept under '
+                             '(default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.graph) as f:
+            components, positions = graph.load(f)
+    except (IOError, graph.GraphFormatError) as e:
+        sys.stderr.write('plumber: {}\n'.format(e))
+        return 1
+
+    if args.metrics == '-':
+        stream = sys.stderr
+    elif args.metrics:
+        stream = open(args.metrics, 'w')
+    else:
+        stream = None
+
+    result_cache = None
+    if args.cache is not None:
+        result_cache = cache.ResultCache(args.cache or None,
+                                         int(args.cache_size * 2 ** 30))
+
+    if args.processes:
+        pipeline = ProcessPipeline(components, result_cache,
+                                   int(args.ring_size * 2 ** 20), args.batch)
+    else:
+        pipeline = Pipeline(components, result_cache)
+    sampler = metrics.Sampler(pipeline)
+    pipeline.start()
+    try:
+        if stream is not None:
+            while pipeline.is_running() and not pipeline.cancelled:
+                time.sleep(args.interval)
+                stream.write(json.dumps(sampler.sample()) + '\n')
+                stream.flush()
+        # Waiting also stops workers that are stuck after a failure.
+        pipeline.wait()
+    except KeyboardInterrupt:
+        pipeline.cancel()
+        pipeline.wait()
+    finally:
+        if stream not in (None, sys.stderr):
+            stream.close()
+
+    for component, error in pipeline.errors:
+        sys.stderr.write('plumber: {} failed: {}\n'.format(component.name,
+                                                           error))
+    return 1 if pipeline.errors or pipeline.cancelled else 0
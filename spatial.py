@@ -0,0 +1,58 @@
+class GridIndex(object):
+    '''Finds items by bounding box, using a uniform grid of buckets.
+
+    Boxes are (x1, y1, x2, y2) tuples.  Each item is filed under every cell
+    its box touches, so a query only looks at the items near it.'''
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.boxes = {}
+
+    def cells_for(self, box):
+        x1, y1, x2, y2 = box
+        size = self.cell_size
+        for i in range(int(x1 // size), int(x2 // size) + 1):
+            for j in range(int(y1 // size), int(y2 // size) + 1):
+                yield (i, j)
+
+    def insert(self, item, box):
+        self.remove(item)
+        self.boxes[item] = box
+        for cell in self.cells_for(box):
+            self.cells.setdefault(cell, set()).add(item)
+
+    def remove(self, item):
+        box = self.boxes.pop(item, None)
+        if box is None:
+            return
+
+        for cell in self.cells_for(box):
+            bucket = self.cells[cell]
+            bucket.discard(item)
+            if not bucket:
+                del self.cells[cell]
+
+    def query(self, box):
+        'Returns the items whose boxes intersect box.'
+        found = set()
+        for cell in self.cells_for(box):
+            bucket = self.cells.get(cell)
+            if bucket:
+                found.update(bucket)
+
+        return [item for item in found
+                if intersects(self.boxes[item], box)]
+
+    def query_point(self, x, y):
+        return self.query((x, y, x, y))
+
+    def clear(self):
+        self.cells = {}
+        self.boxes = {}
+
+    def __len__(self):
+        return len(self.boxes)
+
+def intersects(a, b):
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]